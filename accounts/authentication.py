@@ -1,11 +1,43 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from accounts.hooks import check_user
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from accounts.identity import get_token_user, identity_cache
 
 import logging
 
 logger = logging.getLogger('loki')
 
 class TwoFactorAuthentication(JWTAuthentication):
+    """
+    Accepts access tokens issued after OTP verification, for users who also exist in
+    the contacts database. Both users are read through the identity cache, so a
+    repeat request normally costs no queries; the contacts user is attached to the
+    request as `request.contact_user` for views to reuse.
+
+    With STATELESS_TOKEN_USER on, request.user is an OTPTokenUser built from the
+    token's claims where they can be trusted, and the auth database is not read.
+    """
+    token_users = True
+
+    def get_user(self, validated_token):
+        if self.token_users and settings.STATELESS_TOKEN_USER:
+            user = get_token_user(validated_token)
+            if user is not None:
+                return user
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Inactive users are never cached, so they are reported as not found.
+        user = identity_cache.get_auth_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return user
+
     def authenticate(self, request):
         values = super().authenticate(request)
         if values is None:
@@ -21,8 +53,19 @@ class TwoFactorAuthentication(JWTAuthentication):
             logger.warn('User has not verified OTP.', extra={'action': 'check_token', 'request': request, 'user_id': user.id})
             return None
 
-        if not check_user(user):
+        contact_user = identity_cache.get_contact_user(user.id)
+        if contact_user is None:
             logger.warn('User does not have permission to access this portal.', extra={'action': 'check_token', 'request': request, 'user_id': user.id})
             return None
 
-        return user, validated_token
\ No newline at end of file
+        request.contact_user = contact_user
+
+        return user, validated_token
+
+
+class TwoFactorModelAuthentication(TwoFactorAuthentication):
+    """
+    TwoFactorAuthentication that always loads the AuthUser, for views that need more
+    of it than the token claims.
+    """
+    token_users = False
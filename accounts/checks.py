@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from contact_backend.caches import shared_cache_configured
+
+
+@register(Tags.caches, Tags.security)
+def check_token_user_cache(app_configs, **kwargs):
+    # revoke_token_claims() records revocations in the cache; a per-process cache would
+    # leave the other workers trusting a deactivated user's tokens.
+    if not settings.STATELESS_TOKEN_USER or shared_cache_configured():
+        return []
+    return [Error(
+        'STATELESS_TOKEN_USER requires a cache shared by all processes.',
+        hint='Set DJANGO_CACHE_BACKEND to a shared cache such as Redis or Memcached, or turn DJANGO_STATELESS_TOKEN_USER off.',
+        id='accounts.E001',
+    )]
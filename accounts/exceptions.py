@@ -1,11 +1,26 @@
 from typing import Any, Optional
 
+from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
 
 import logging
 logger = logging.getLogger('loki')
 
+
+class PasswordHashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins are being processed. Try again shortly.'
+    default_code = 'password_hashing_unavailable'
+
+
+class VaultUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The secrets service is unavailable. Try again shortly.'
+    default_code = 'vault_unavailable'
+
+
 def core_exception_handler(exc: Exception, context: dict[str, Any]) -> Optional[Response]:
     """Error handler for the API."""
     response = exception_handler(exc, context)
@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Optional
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.db import close_old_connections
+
+from .exceptions import PasswordHashingUnavailable
+
+import logging
+logger = logging.getLogger('loki')
+
+
+@lru_cache(maxsize=None)
+def load_argon2_profile(path: str) -> Optional[dict]:
+    '''
+    Returns the cost parameters written by `manage.py calibrate_argon2`, or None if
+    the host has not been calibrated.
+    '''
+    try:
+        with open(path) as profile:
+            return json.load(profile)
+    except FileNotFoundError:
+        return None
+
+
+class CalibratedArgon2PasswordHasher(Argon2PasswordHasher):
+    '''
+    Argon2 with the time, memory and parallelism costs from ARGON2_PROFILE, falling
+    back to Django's defaults when there is no profile.
+
+    It keeps the 'argon2' algorithm name, so existing hashes are verified as before;
+    must_update() compares their parameters with the profile's, and Django rehashes
+    the password with the new costs on the user's next successful login.
+    '''
+
+    def __init__(self):
+        profile = load_argon2_profile(str(settings.ARGON2_PROFILE))
+        if profile is not None:
+            self.time_cost = profile['time_cost']
+            self.memory_cost = profile['memory_cost']
+            self.parallelism = profile['parallelism']
+
+
+class PasswordHashingExecutor():
+    '''
+    Runs password hashing on a fixed pool of PASSWORD_HASHING_WORKERS threads, so a
+    burst of logins cannot take every request worker. argon2 releases the GIL while
+    hashing, so the pool's threads hash in parallel.
+
+    At most PASSWORD_HASHING_QUEUE calls wait for a free thread; beyond that run()
+    fails at once with PasswordHashingUnavailable (503) instead of queueing. stats()
+    reports the current queue depth and counters for logging.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._average_wait = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                workers = settings.PASSWORD_HASHING_WORKERS
+                self._slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASHING_QUEUE)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            return self._executor
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            logger.warn('Password hashing is saturated.', extra={'action': 'password_hashing', 'password_hashing': self.stats()})
+            raise PasswordHashingUnavailable()
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return executor.submit(self._call, time.monotonic(), fn, args, kwargs).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _call(self, submitted: float, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._running += 1
+            # Exponential moving average over roughly the last 20 calls.
+            self._average_wait += 0.05 * (time.monotonic() - submitted - self._average_wait)
+        # The pool's threads outlive requests, so manage their connections the way
+        # request_started/request_finished do.
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def stats(self) -> dict:
+        '''
+        Returns the current queue depth and running calls, the calls completed and
+        rejected so far, and the recent average wait for a thread in milliseconds.
+        '''
+        with self._lock:
+            return {
+                'queued': self._in_flight - self._running,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'average_wait_ms': round(self._average_wait * 1000, 1),
+            }
+
+
+password_hashing = PasswordHashingExecutor()
@@ -4,6 +4,7 @@
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.response import Response
+from .identity import identity_cache
 from .models import AuthUser
 from .serializers import UserSerializer
 from contacts.models import Users
@@ -47,8 +48,4 @@ def check_user(user: AuthUser):
     """
     This function is called after a user logs in.
     """
-    try:
-        Users.objects.get(id=user.id)
-    except Users.DoesNotExist:
-        return False
-    return True
\ No newline at end of file
+    return identity_cache.get_contact_user(user.id) is not None
\ No newline at end of file
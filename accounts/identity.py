@@ -0,0 +1,152 @@
+from typing import Optional
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from contacts.models import Users
+from .models import AuthUser
+
+
+class IdentityCache():
+    '''
+    Per-process cache of the rows every authenticated request needs: the active
+    AuthUser behind a token and its Users row in main_db.
+
+    Only found rows are cached, each for IDENTITY_CACHE_TIMEOUT seconds. Saves and
+    deletes in this process evict the user at once (see signals.py); other processes
+    see the change when their entry expires, so the timeout bounds how long a
+    deactivated or removed user keeps access.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        # Callers get their own copy, so changes made while handling one request do
+        # not leak into the next.
+        return copy.copy(entry[1])
+
+    def _set(self, key: tuple, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + settings.IDENTITY_CACHE_TIMEOUT, copy.copy(value))
+            if len(self._entries) > settings.IDENTITY_CACHE_MAX_ENTRIES:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] >= now}
+                if len(self._entries) > settings.IDENTITY_CACHE_MAX_ENTRIES:
+                    self._entries = {}
+
+    def get_auth_user(self, user_id: uuid.UUID) -> Optional[AuthUser]:
+        '''
+        Returns the active AuthUser with this ID, or None if there is none.
+        '''
+        user = self._get(('auth', str(user_id)))
+        if user is None:
+            user = AuthUser.objects.filter(id=user_id, is_active=True).first()
+            if user is not None:
+                self._set(('auth', str(user_id)), user)
+        return user
+
+    def get_contact_user(self, user_id: uuid.UUID) -> Optional[Users]:
+        '''
+        Returns the Users row with this ID, or None if the user has no access to the
+        contacts portal.
+        '''
+        user = self._get(('contact', str(user_id)))
+        if user is None:
+            user = Users.objects.filter(id=user_id).first()
+            if user is not None:
+                self._set(('contact', str(user_id)), user)
+        return user
+
+    def invalidate(self, user_id: uuid.UUID):
+        # Keys are strings: token claims carry the ID as text, model instances as a UUID.
+        with self._lock:
+            self._entries.pop(('auth', str(user_id)), None)
+            self._entries.pop(('contact', str(user_id)), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+identity_cache = IdentityCache()
+
+
+# Copied from the AuthUser into tokens minted after OTP verification, so OTPTokenUser
+# can stand in for it.
+TOKEN_USER_CLAIMS = ('username', 'has_otp', 'is_active', 'is_staff')
+CLAIMS_AT_CLAIM = 'claims_at'
+
+
+def token_user_claims(user: AuthUser) -> dict:
+    claims = {claim: getattr(user, claim) for claim in TOKEN_USER_CLAIMS}
+    claims[CLAIMS_AT_CLAIM] = int(time.time())
+    return claims
+
+
+def _revoked_key(user_id) -> str:
+    return f'identity:revoked:{user_id}'
+
+
+def revoke_token_claims(user_id: uuid.UUID):
+    '''
+    Stops trusting the claims in this user's existing tokens: they are resolved
+    against the database again. Claims are only trusted for an access token lifetime
+    (see get_token_user()), so the entry need not outlive it.
+    '''
+    cache.set(_revoked_key(user_id), time.time(), timeout=int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()))
+
+
+class OTPTokenUser(TokenUser):
+    '''
+    Stateless stand-in for AuthUser, built from the claims of a token minted by
+    ValidateTOTPSerializer. It has no database row: views that read or change other
+    AuthUser fields need TwoFactorModelAuthentication.
+    '''
+
+    @cached_property
+    def id(self):
+        # A UUID, like AuthUser.id, rather than the claim's string.
+        return uuid.UUID(str(self.token[api_settings.USER_ID_CLAIM]))
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def has_otp(self):
+        return self.token.get('has_otp', False)
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+
+def get_token_user(validated_token) -> Optional[OTPTokenUser]:
+    '''
+    Returns an OTPTokenUser for the token, or None if its claims cannot be trusted and
+    the user has to be loaded instead: they are missing, older than an access token
+    lifetime (TokenUserRefreshSerializer stamps fresh ones on every refresh), or
+    revoked since minted.
+    '''
+    claims_at = validated_token.get(CLAIMS_AT_CLAIM)
+    if claims_at is None or any(claim not in validated_token for claim in TOKEN_USER_CLAIMS):
+        return None
+    if claims_at < time.time() - api_settings.ACCESS_TOKEN_LIFETIME.total_seconds():
+        return None
+    revoked_at = cache.get(_revoked_key(validated_token[api_settings.USER_ID_CLAIM]))
+    if revoked_at is not None and claims_at <= revoked_at:
+        return None
+    user = OTPTokenUser(validated_token)
+    return user if user.is_active else None
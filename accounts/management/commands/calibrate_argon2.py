@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import statistics
+import time
+
+import argon2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks Argon2 on this host and writes the strongest time and memory costs '
+        'that hash within the target time to ARGON2_PROFILE. Passwords are rehashed '
+        'with the new costs on each user\'s next login.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='Longest acceptable time for one hash.')
+        parser.add_argument('--max-memory-mib', type=int, default=64, help='Memory cost to start from.')
+        parser.add_argument('--min-memory-mib', type=int, default=16, help='Lowest memory cost to accept.')
+        parser.add_argument(
+            '--parallelism', type=int, default=1,
+            help='Lanes per hash. Concurrent logins already spread over PASSWORD_HASHING_WORKERS threads.',
+        )
+        parser.add_argument('--rounds', type=int, default=5, help='Hashes timed per setting; the median is used.')
+        parser.add_argument('--output', default=str(settings.ARGON2_PROFILE), help='Where to write the profile.')
+
+    def _measure(self, time_cost: int, memory_cost: int, parallelism: int, rounds: int) -> float:
+        hasher = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            hasher.hash('calibration password')
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        target, rounds, parallelism = options['target_ms'], options['rounds'], options['parallelism']
+        memory_cost, min_memory_cost = options['max_memory_mib'] * 1024, options['min_memory_mib'] * 1024
+
+        # Prefer memory over passes (as RFC 9106 recommends): halve the memory until one
+        # pass fits the target, then add passes while they still fit.
+        while True:
+            elapsed = self._measure(1, memory_cost, parallelism, rounds)
+            self.stdout.write(f'memory {memory_cost // 1024} MiB, time 1: {elapsed:.0f} ms')
+            if elapsed <= target:
+                break
+            if memory_cost // 2 < min_memory_cost:
+                raise CommandError(f'One pass over {memory_cost // 1024} MiB takes {elapsed:.0f} ms, over the {target:.0f} ms target.')
+            memory_cost //= 2
+
+        time_cost = 1
+        while True:
+            candidate = self._measure(time_cost + 1, memory_cost, parallelism, rounds)
+            self.stdout.write(f'memory {memory_cost // 1024} MiB, time {time_cost + 1}: {candidate:.0f} ms')
+            if candidate > target:
+                break
+            time_cost, elapsed = time_cost + 1, candidate
+
+        profile = {
+            'time_cost': time_cost,
+            'memory_cost': memory_cost,
+            'parallelism': parallelism,
+            'hash_ms': round(elapsed, 1),
+            'target_ms': target,
+            'host': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'argon2_cffi': argon2.__version__,
+            'calibrated_at': datetime.now(timezone.utc).isoformat(),
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(profile, output, indent=2)
+            output.write('\n')
+
+        workers = settings.PASSWORD_HASHING_WORKERS
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {options["output"]}: time {time_cost}, memory {memory_cost // 1024} MiB, parallelism {parallelism} '
+            f'({elapsed:.0f} ms per hash, up to {workers * memory_cost // 1024} MiB across {workers} hashing workers).'
+        ))
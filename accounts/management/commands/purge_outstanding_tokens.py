@@ -0,0 +1,56 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+
+def _parse_cutoff(value: str):
+    try:
+        cutoff = parse_datetime(value)
+    except ValueError:
+        cutoff = None
+    if cutoff is None:
+        raise argparse.ArgumentTypeError(f'"{value}" is not an ISO 8601 date or date and time.')
+    return cutoff if timezone.is_aware(cutoff) else timezone.make_aware(cutoff)
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired outstanding refresh tokens, in short batches. With '
+        '--unblacklisted-before, also deletes never blacklisted tokens created before '
+        'then, such as the unused ones logins recorded before they stopped minting '
+        'refresh tokens.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per transaction.')
+        parser.add_argument(
+            '--unblacklisted-before', type=_parse_cutoff, metavar='DATETIME',
+            help='Also delete never blacklisted tokens created before this time. Live refresh tokens among them stop working.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted.')
+
+    def handle(self, *args, **options):
+        condition = Q(expires_at__lt=timezone.now())
+        if options['unblacklisted_before'] is not None:
+            condition |= Q(blacklistedtoken__isnull=True, created_at__lt=options['unblacklisted_before'])
+        tokens = OutstandingToken.objects.filter(condition)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Would delete {tokens.count()} outstanding tokens.'))
+            return
+
+        deleted = 0
+        while True:
+            # Short transactions, so logins and logouts are not held up behind the purge.
+            with transaction.atomic(using=tokens.db):
+                ids = list(tokens.values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                # Deleting by ID also removes the blacklist entries of expired tokens.
+                deleted += OutstandingToken.objects.filter(id__in=ids).delete()[1].get(OutstandingToken._meta.label, 0)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} outstanding tokens.'))
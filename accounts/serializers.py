@@ -1,13 +1,18 @@
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import exceptions, serializers
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken, TokenError
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from hvac.exceptions import InvalidRequest
 
+from .hashers import password_hashing
+from .identity import CLAIMS_AT_CLAIM, token_user_claims
 from .models import AuthUser
 from .utils import validate_email as email_is_valid
-from .vault import create_vault_client
+from .vault import get_vault_client
 from .vault.totp import TOTP
 
 
@@ -65,10 +70,15 @@ class LoginSerializer(serializers.ModelSerializer[AuthUser]):
     tokens = serializers.SerializerMethodField()
 
     def get_tokens(self, obj):  # type: ignore
-        """Get user token."""
-        user = AuthUser.objects.get(username=obj.username)
+        """
+        Get a short-lived access token for the OTP steps. `obj` is the user validate()
+        authenticated; the refresh token is only issued once the OTP is verified, so
+        nothing is recorded in the outstanding token list here.
+        """
+        access = AccessToken.for_user(obj)
+        access.set_exp(lifetime=settings.PRE_OTP_ACCESS_TOKEN_LIFETIME)
 
-        return {'refresh': 'unused', 'access': user.tokens['access']}
+        return {'refresh': 'unused', 'access': str(access)}
 
     class Meta:
         model = AuthUser
@@ -84,7 +94,8 @@ class LoginSerializer(serializers.ModelSerializer[AuthUser]):
         if password is None:
             raise serializers.ValidationError('A password is required to log in.')
 
-        user = authenticate(username=username, password=password)
+        # Hashes on the bounded pool; raises PasswordHashingUnavailable when it is full.
+        user = password_hashing.run(authenticate, username=username, password=password)
 
         if user is None:
             raise serializers.ValidationError('A user with this username and password was not found.')
@@ -175,6 +186,9 @@ class ValidateTOTPSerializer(serializers.Serializer):
     def get_token(cls, user):
         tk = RefreshToken.for_user(user)
         tk['verified_otp'] = True
+        # Lets TwoFactorAuthentication skip loading the user when STATELESS_TOKEN_USER is on.
+        for claim, value in token_user_claims(user).items():
+            tk[claim] = value
         return {
             'refresh': str(tk),
             'access': str(tk.access_token),
@@ -191,7 +205,7 @@ class ValidateTOTPSerializer(serializers.Serializer):
             raise AuthenticationFailed('A TOTP device needs to be registered first.', code='no_totp_device')
 
         # Connect to Vault and verify TOTP value
-        vault = create_vault_client()
+        vault = get_vault_client()
         totp_vault = TOTP(vault)
         try:
             res = totp_vault.validate_code(name=self.context['request'].user.id, code=totp)
@@ -202,3 +216,30 @@ class ValidateTOTPSerializer(serializers.Serializer):
             raise AuthenticationFailed('An unexpected error occurred', code='totp_login_failed')
         
         return self.get_token(self.context['request'].user)
+
+
+class TokenUserRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer that re-reads the user and stamps current claims (see
+    token_user_claims()) into the new tokens, so refreshed access tokens stay within
+    get_token_user()'s trust window instead of falling back to a database lookup.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if CLAIMS_AT_CLAIM in refresh:
+            user = AuthUser.objects.filter(id=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+            if user is None:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            for claim, value in token_user_claims(user).items():
+                refresh[claim] = value
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
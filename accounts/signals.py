@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from contacts.models import Users
+from .identity import TOKEN_USER_CLAIMS, identity_cache, revoke_token_claims
+from .models import AuthUser
+
+
+@receiver([post_save, post_delete], sender=AuthUser)
+def auth_user_changed(sender, instance, update_fields=None, **kwargs):
+    # Saves of named fields (e.g. a password rehashed on login) only matter if they
+    # touch a claim copied into the user's tokens.
+    if update_fields is not None and not set(update_fields) & set(TOKEN_USER_CLAIMS):
+        return
+    revoke_token_claims(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AuthUser)
+@receiver([post_save, post_delete], sender=Users)
+def identity_changed(sender, instance, using, **kwargs):
+    # After commit, so a concurrent request cannot cache the old row again.
+    user_id = instance.pk
+    transaction.on_commit(lambda: identity_cache.invalidate(user_id), using=using)
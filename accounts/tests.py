@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+import io
+from unittest import mock
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from contacts.models import Users
+from .authentication import TwoFactorAuthentication
+from .identity import CLAIMS_AT_CLAIM, OTPTokenUser, identity_cache
+from .models import AuthUser
+from .serializers import TokenUserRefreshSerializer, ValidateTOTPSerializer
+
+
+@override_settings(STATELESS_TOKEN_USER=True)
+class TokenUserRefreshTests(TestCase):
+    databases = {'default', 'main_db'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AuthUser.objects.create_user('tester', 'tester@example.com', 'correct horse battery')
+        cls.user.has_otp = True
+        cls.user.save()
+        Users.objects.create(
+            id=cls.user.id, nric='S0000001A', name='Test User', dob=date(1990, 1, 1),
+            phone='91234567', gender='F', address='1 Test Road', postal_code='100001',
+        )
+
+    def setUp(self):
+        # Tokens whose claims were stamped longer than an access token lifetime ago.
+        stamped_at = time.time() - 2 * api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        with mock.patch('accounts.identity.time.time', return_value=stamped_at):
+            self.tokens = ValidateTOTPSerializer.get_token(self.user)
+        # Drop the revocation recorded when the user was saved.
+        cache.clear()
+        identity_cache.clear()
+        # Warm the contacts user, which is cached whatever the token says.
+        identity_cache.get_contact_user(self.user.id)
+
+    def authenticate(self, access: str):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        return TwoFactorAuthentication().authenticate(request)
+
+    def test_refreshed_access_token_is_trusted_without_queries(self):
+        serializer = TokenUserRefreshSerializer(data={'refresh': self.tokens['refresh']})
+        serializer.is_valid(raise_exception=True)
+
+        with self.assertNumQueries(0, using='default'), self.assertNumQueries(0, using='main_db'):
+            user, token = self.authenticate(serializer.validated_data['access'])
+        self.assertIsInstance(user, OTPTokenUser)
+        self.assertEqual(user.id, self.user.id)
+        self.assertGreater(token[CLAIMS_AT_CLAIM], time.time() - 60)
+
+    def test_stale_claims_are_resolved_against_the_database(self):
+        with self.assertNumQueries(1, using='default'):
+            user, _ = self.authenticate(self.tokens['access'])
+        self.assertIsInstance(user, AuthUser)
+
+    def test_refresh_fails_for_inactive_user(self):
+        AuthUser.objects.filter(id=self.user.id).update(is_active=False)
+        serializer = TokenUserRefreshSerializer(data={'refresh': self.tokens['refresh']})
+
+        with self.assertRaises(AuthenticationFailed):
+            serializer.is_valid()
+
+
+class PurgeOutstandingTokensTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = AuthUser.objects.create_user('tester', 'tester@example.com', 'correct horse battery')
+        cls.live = RefreshToken.for_user(user)
+        cls.blacklisted = RefreshToken.for_user(user)
+        cls.blacklisted.blacklist()
+        past = timezone.now() - timedelta(days=30)
+        OutstandingToken.objects.create(user=user, jti='expired', token='expired', created_at=past, expires_at=past)
+
+    def purge(self, *args):
+        call_command('purge_outstanding_tokens', *args, stdout=io.StringIO())
+        return set(OutstandingToken.objects.values_list('jti', flat=True))
+
+    def test_default_run_only_deletes_expired_tokens(self):
+        self.assertEqual(self.purge(), {self.live['jti'], self.blacklisted['jti']})
+
+    def test_unblacklisted_tokens_are_deleted_on_request(self):
+        cutoff = (timezone.now() + timedelta(minutes=1)).isoformat()
+        self.assertEqual(self.purge('--unblacklisted-before', cutoff), {self.blacklisted['jti']})
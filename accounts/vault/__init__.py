@@ -1,16 +1,23 @@
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 import hvac
+import os
 import requests 
+import threading
+import time
 
-def create_vault_client() -> hvac.Client:
+from .resilience import call_vault, operation_timeout, vault_operation_stats
+
+def create_vault_client(session: requests.Session = None) -> hvac.Client:
     """
     Instantiates a hvac / vault client.
+    :param session: Optional requests session for the client to send its requests through.
     :return: hvac.Client
     """
-    vault_client = hvac.Client(**settings.VAULT_SETTINGS)
+    vault_client = hvac.Client(**settings.VAULT_SETTINGS, session=session)
 
-    if 'certs' in settings.VAULT_SETTINGS and settings.VAULT_SETTINGS.certs:
+    if session is None and 'certs' in settings.VAULT_SETTINGS and settings.VAULT_SETTINGS.certs:
         # When use a self-signed certificate for the vault service itself, we need to
         # include our local ca bundle here for the underlying requests module.
         rs = requests.Session()
@@ -19,8 +26,134 @@ def create_vault_client() -> hvac.Client:
 
     # vault_client.token = _load_vault_token(vault_client)
 
-    if not vault_client.is_authenticated():
+    if not call_vault('auth.check', vault_client.is_authenticated, idempotent=True):
             error_msg = 'Unable to authenticate to the Vault service'
             raise hvac.exceptions.Unauthorized(error_msg)
 
     return vault_client
+
+
+class VaultSession(requests.Session):
+    """
+    Keep-alive session shared by every Vault request in the process.
+    Connections are pooled per host and the latency of each request is recorded.
+    Every request times out after the limit set for the current call_vault()
+    operation, or VAULT_TIMEOUT outside one.
+    """
+
+    def __init__(self, pool_maxsize: int):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        # Mutual TLS: the client certificate and CA bundle are set on the session
+        # so every pooled connection is established with them.
+        self.verify = settings.VAULT_SETTINGS.get('verify', True)
+        self.cert = settings.VAULT_SETTINGS.get('cert')
+
+        self._stats_lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def request(self, method, url, *args, **kwargs):
+        # Replaces the 30 second default hvac passes on every request.
+        kwargs['timeout'] = operation_timeout.get() or settings.VAULT_TIMEOUT
+        start = time.perf_counter()
+        failed = False
+        try:
+            return super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.request_count += 1
+                self.error_count += failed
+                self.total_latency += elapsed
+                self.max_latency = max(self.max_latency, elapsed)
+
+    def pool_stats(self) -> list[dict]:
+        pools = []
+        # The same adapter is mounted for both schemes; report it once.
+        adapters = {id(adapter): adapter for adapter in self.adapters.values()}
+        for adapter in adapters.values():
+            manager = adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle_connections': pool.pool.qsize() if pool.pool is not None else 0,
+                })
+        return pools
+
+
+_client = None
+_client_lock = threading.Lock()
+_token_checked_at = 0.0
+_token_checks = 0
+
+
+def get_vault_client() -> hvac.Client:
+    """
+    Returns the Vault client shared by the whole process.
+
+    The client is created on first use and reuses pooled keep-alive connections.
+    Its token is only re-validated every VAULT_TOKEN_CHECK_INTERVAL seconds
+    instead of on every call.
+    :return: hvac.Client
+    """
+    global _client, _token_checked_at, _token_checks
+
+    with _client_lock:
+        now = time.monotonic()
+        if _client is None:
+            _client = create_vault_client(session=VaultSession(settings.VAULT_POOL_MAXSIZE))
+            _token_checked_at = now
+            _token_checks += 1
+        elif now - _token_checked_at >= settings.VAULT_TOKEN_CHECK_INTERVAL:
+            _token_checks += 1
+            if not call_vault('auth.check', _client.is_authenticated, idempotent=True):
+                raise hvac.exceptions.Unauthorized('Unable to authenticate to the Vault service')
+            _token_checked_at = now
+        return _client
+
+
+def vault_client_stats() -> dict:
+    """
+    Connection pool and latency statistics for the shared Vault client, with latency
+    histograms per operation and the circuit breaker's state.
+    :return: dict
+    """
+    client = _client
+    if client is None:
+        return {'requests': 0, 'errors': 0, 'token_checks': _token_checks, 'pools': [], **vault_operation_stats()}
+    session = client.session
+    with session._stats_lock:
+        count = session.request_count
+        stats = {
+            'requests': count,
+            'errors': session.error_count,
+            'avg_latency_ms': session.total_latency / count * 1000 if count else 0.0,
+            'max_latency_ms': session.max_latency * 1000,
+        }
+    stats['token_checks'] = _token_checks
+    stats['pools'] = session.pool_stats()
+    stats.update(vault_operation_stats())
+    return stats
+
+
+def _reset_after_fork():
+    # Pooled sockets must not be shared between a parent and its forked workers.
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,165 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+import random
+import threading
+import time
+
+from django.conf import settings
+from hvac import exceptions as vault_exceptions
+import requests
+
+from ..exceptions import VaultUnavailable
+
+import logging
+logger = logging.getLogger('loki')
+
+# Timeout for the Vault requests made by the current call_vault() operation; read by
+# VaultSession.request.
+operation_timeout: ContextVar[Optional[float]] = ContextVar('vault_operation_timeout', default=None)
+
+# Failures that say nothing about the request itself: Vault (or the way to it) is down,
+# slow or overloaded. Anything else, e.g. InvalidPath or Forbidden, is a real answer.
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    vault_exceptions.InternalServerError,
+    vault_exceptions.VaultDown,
+    vault_exceptions.BadGateway,
+    vault_exceptions.RateLimitExceeded,
+)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram():
+    '''
+    Cumulative latency histogram of one Vault operation, in the usual `le` bucket form.
+    '''
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def observe(self, elapsed_ms: float, failed: bool):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+
+    def snapshot(self) -> dict:
+        buckets, cumulative = {}, 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'errors': self.errors, 'sum_ms': round(self.total_ms, 1), 'buckets': buckets}
+
+
+class CircuitBreaker():
+    '''
+    Opens after VAULT_BREAKER_THRESHOLD consecutive transient failures, making calls
+    fail at once instead of tying up a worker for a full timeout each. After
+    VAULT_BREAKER_RESET seconds one trial call is let through: success closes the
+    breaker again, otherwise it stays open for another period.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        return 'closed' if self._opened_at is None else 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < settings.VAULT_BREAKER_RESET:
+                return False
+            # Let this call through as the trial; the rest keep failing fast for another
+            # period unless it succeeds.
+            self._opened_at = time.monotonic()
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            if success:
+                self._failures, self._opened_at = 0, None
+                return
+            self._failures += 1
+            if self._opened_at is None and self._failures >= settings.VAULT_BREAKER_THRESHOLD:
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logger.warn('Vault circuit breaker opened.', extra={'action': 'vault', 'failures': self._failures})
+
+
+breaker = CircuitBreaker()
+_histograms: dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _observe(operation: str, elapsed_ms: float, failed: bool):
+    with _histograms_lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = LatencyHistogram()
+        histogram.observe(elapsed_ms, failed)
+
+
+def call_vault(operation: str, fn: Callable[..., Any], *args, idempotent: bool = False, **kwargs) -> Any:
+    '''
+    Calls `fn(*args, **kwargs)`, a Vault request, as the named operation:
+
+    - its requests time out after VAULT_OPERATION_TIMEOUTS[operation] seconds (or
+      VAULT_TIMEOUT);
+    - if `idempotent`, a transient failure is retried up to VAULT_READ_RETRIES times
+      with full-jitter exponential backoff;
+    - while the circuit breaker is open it raises VaultUnavailable without calling;
+    - every attempt's latency is recorded in the operation's histogram.
+
+    Transient failures that are not retried raise VaultUnavailable (503); other Vault
+    errors are raised unchanged.
+    '''
+    if not breaker.allow():
+        raise VaultUnavailable()
+
+    attempts = 1 + (settings.VAULT_READ_RETRIES if idempotent else 0)
+    token = operation_timeout.set(settings.VAULT_OPERATION_TIMEOUTS.get(operation, settings.VAULT_TIMEOUT))
+    try:
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                _observe(operation, (time.perf_counter() - started) * 1000, failed=True)
+                if attempt + 1 == attempts:
+                    breaker.record(success=False)
+                    logger.warn('Vault call failed.', extra={'action': 'vault', 'operation': operation, 'attempts': attempts, 'exception': e.__class__.__name__})
+                    raise VaultUnavailable() from e
+                time.sleep(random.uniform(0, settings.VAULT_RETRY_BACKOFF * 2 ** attempt))
+            except vault_exceptions.VaultError:
+                # Vault answered; the request itself was refused.
+                _observe(operation, (time.perf_counter() - started) * 1000, failed=True)
+                breaker.record(success=True)
+                raise
+            else:
+                _observe(operation, (time.perf_counter() - started) * 1000, failed=False)
+                breaker.record(success=True)
+                return result
+    finally:
+        operation_timeout.reset(token)
+
+
+def vault_operation_stats() -> dict:
+    '''
+    Latency histograms per operation, plus the circuit breaker's state.
+    '''
+    with _histograms_lock:
+        operations = {operation: histogram.snapshot() for operation, histogram in _histograms.items()}
+    return {'operations': operations, 'breaker': {'state': breaker.state, 'opened': breaker.opened}}
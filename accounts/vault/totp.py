@@ -1,6 +1,8 @@
 """TOTP methods module."""
 from hvac import exceptions, utils
 
+from .resilience import call_vault
+
 DEFAULT_MOUNT_POINT = "totp"
 
 class TOTP ():
@@ -82,7 +84,9 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/keys/{name}", mount_point=mount_point, name=name
         )
-        return self._client.write(
+        return call_vault(
+            'totp.create_key',
+            self._client.write,
             path=api_path,
             **params,
         )
@@ -106,7 +110,10 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/keys/{name}", mount_point=mount_point, name=name
         )
-        return self._client.read(
+        return call_vault(
+            'totp.read_key',
+            self._client.read,
+            idempotent=True,
             path=api_path,
         )
 
@@ -126,7 +133,10 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/keys", mount_point=mount_point
         )
-        return self._client.list(
+        return call_vault(
+            'totp.list_keys',
+            self._client.list,
+            idempotent=True,
             path=api_path,
         )
 
@@ -149,7 +159,9 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/keys/{name}", mount_point=mount_point, name=name
         )
-        return self._client.delete(
+        return call_vault(
+            'totp.delete_key',
+            self._client.delete,
             path=api_path,
         )
 
@@ -172,7 +184,10 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/code/{name}", mount_point=mount_point, name=name
         )
-        return self._client.read(
+        return call_vault(
+            'totp.generate_code',
+            self._client.read,
+            idempotent=True,
             path=api_path,
         )
 
@@ -201,7 +216,11 @@ class TOTP ():
         api_path = utils.format_url(
             "{mount_point}/code/{name}", mount_point=mount_point, name=name
         )
-        return self._client.write(
+        # Not retried: Vault rejects a code that has already been used, so a retry after
+        # a lost response would report a valid code as invalid.
+        return call_vault(
+            'totp.validate_code',
+            self._client.write,
             path=api_path,
             **params,
         )
\ No newline at end of file
@@ -10,6 +10,8 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from .authentication import TwoFactorModelAuthentication
+from .hashers import password_hashing
 from .models import AuthUser
 from .renderers import UserJSONRenderer
 from .serializers import (
@@ -20,7 +22,7 @@ from .serializers import (
     RegisterTOTPSerializer,
     ValidateTOTPSerializer
 )
-from .vault import create_vault_client
+from .vault import get_vault_client
 from .vault.totp import TOTP
 from .hooks import (
     post_registration_hook,
@@ -55,7 +57,7 @@ class LoginAPIView(APIView):
         """Return user after login."""
         user = request.data
 
-        logger.info('User login request.', extra={'action': 'login', 'request': request})
+        logger.info('User login request.', extra={'action': 'login', 'request': request, 'password_hashing': password_hashing.stats()})
         serializer = self.serializer_class(data=user)
         if not serializer.is_valid():
             logger.warn('User login failed.', extra={'action': 'login', 'request': request})
@@ -64,6 +66,8 @@ class LoginAPIView(APIView):
 
 
 class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
+    # Serializes AuthUser fields that are not in the token.
+    authentication_classes = (TwoFactorModelAuthentication,)
     permission_classes = (IsAuthenticated,)
     renderer_classes = (UserJSONRenderer,)
     serializer_class = UserSerializer
@@ -116,7 +120,7 @@ class RegisterTOTPView(APIView):
         serializer = self.serializer_class(request.user, data={'has_otp': True}, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        vault = create_vault_client()
+        vault = get_vault_client()
         totp = TOTP(vault)
 
         img = totp.create_key(generate=True, name=request.user.id, issuer='TraceIT', account_name=request.user.username)
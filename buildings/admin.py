@@ -2,11 +2,41 @@ from django.contrib import admin
 
 # Register your models here.
 
+from .catalog import building_catalog
 from .models import (
     Buildings,
     Buildingaccess
 )
-# Register your models here.
-@admin.register(Buildingaccess, Buildings)
+
+
+class BuildingFilter(admin.SimpleListFilter):
+    title = 'building'
+    parameter_name = 'building'
+
+    def lookups(self, request, model_admin):
+        return [(building.id, building.name) for building in building_catalog.all()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(building_id=self.value())
+        return queryset
+
+
+@admin.register(Buildings)
 class BuildingAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    list_display = ('name', 'location')
+    search_fields = ('name',)
+
+
+@admin.register(Buildingaccess)
+class BuildingaccessAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'building_name', 'access_timestamp')
+    list_filter = (BuildingFilter,)
+    # Avoid rendering every user into a select box on the change form.
+    raw_id_fields = ('user', 'building')
+
+    @admin.display(description='building')
+    def building_name(self, obj):
+        # From the in-memory catalog rather than a query or join per row.
+        building = building_catalog.get(obj.building_id)
+        return building.name if building else obj.building_id
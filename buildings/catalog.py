@@ -0,0 +1,96 @@
+from typing import Optional
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Buildings
+
+VERSION_KEY = 'buildings:catalog_version'
+
+
+class BuildingCatalog():
+    '''
+    Per-process copy of the buildings table, keyed by building ID.
+
+    The table is small and rarely written, so it is loaded whole on first use and then
+    served from memory. Writes replace a version token in the shared cache (see
+    invalidate()); each process compares it at most every
+    BUILDING_CATALOG_CHECK_INTERVAL seconds and reloads when it has changed.
+
+    Buildings written by other services replace no token, so a copy is also reloaded
+    once it is BUILDING_CATALOG_MAX_AGE seconds old, and get(..., reload_on_miss=True)
+    reloads it early for an unknown ID (at most once per
+    BUILDING_CATALOG_MISS_RELOAD_INTERVAL seconds).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buildings = None
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def _shared_version(self) -> str:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # First use, or evicted: a new random version makes every process reload.
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _load(self):
+        # Must be called with self._lock held.
+        version = self._shared_version()
+        self._buildings = {building.id: building for building in Buildings.objects.all()}
+        self._version = version
+        self._checked_at = self._loaded_at = time.monotonic()
+
+    def _buildings_by_id(self) -> dict[uuid.UUID, Buildings]:
+        buildings, interval = self._buildings, settings.BUILDING_CATALOG_CHECK_INTERVAL
+        if buildings is not None and time.monotonic() - self._checked_at < interval:
+            return buildings
+        with self._lock:
+            now = time.monotonic()
+            if self._buildings is None or now - self._loaded_at >= settings.BUILDING_CATALOG_MAX_AGE:
+                self._load()
+            elif now - self._checked_at >= interval:
+                if self._shared_version() != self._version:
+                    self._load()
+                self._checked_at = time.monotonic()
+            return self._buildings
+
+    def _reload_after_miss(self) -> bool:
+        with self._lock:
+            if self._buildings is not None and time.monotonic() - self._loaded_at < settings.BUILDING_CATALOG_MISS_RELOAD_INTERVAL:
+                return False
+            self._load()
+            return True
+
+    def get(self, building_id: uuid.UUID, reload_on_miss: bool = False) -> Optional[Buildings]:
+        '''
+        Returns the building, or None if it is not in the catalog. With
+        `reload_on_miss`, an unknown ID first reloads the catalog unless it was loaded
+        within the last BUILDING_CATALOG_MISS_RELOAD_INTERVAL seconds.
+        '''
+        building = self._buildings_by_id().get(building_id)
+        if building is None and reload_on_miss and self._reload_after_miss():
+            building = self._buildings.get(building_id)
+        return building
+
+    def all(self) -> list[Buildings]:
+        return sorted(self._buildings_by_id().values(), key=lambda building: building.name)
+
+    def invalidate(self):
+        '''
+        Drops this process's copy and replaces the shared version so every other
+        process reloads on its next check.
+        '''
+        with self._lock:
+            self._buildings = None
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+building_catalog = BuildingCatalog()
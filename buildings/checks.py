@@ -0,0 +1,16 @@
+from django.core.checks import Tags, Warning, register
+
+from contact_backend.caches import shared_cache_configured
+
+
+@register(Tags.caches)
+def check_catalog_cache(app_configs, **kwargs):
+    # Without a shared version token, writes only reach the other workers' catalogs
+    # once their copies are BUILDING_CATALOG_MAX_AGE seconds old.
+    if shared_cache_configured():
+        return []
+    return [Warning(
+        'The default cache is local to each process, so building changes only reach the other workers\' catalogs after BUILDING_CATALOG_MAX_AGE seconds.',
+        hint='Set DJANGO_CACHE_BACKEND and DJANGO_CACHE_LOCATION to a cache shared by all workers.',
+        id='buildings.W001',
+    )]
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from typing import Iterator
+
+from django.db.models import Exists, OuterRef
+
+from contacts.models import Infectionhistory
+from contacts.status import STATUS_WINDOW
+from .catalog import building_catalog
+from .models import Buildingaccess
+
+
+def co_located_accesses(infection: Infectionhistory, dwell: timedelta):
+    '''
+    Returns the building accesses of other users that fall within `dwell` of an access
+    by the infected user to the same building, during the STATUS_WINDOW before the
+    infection was recorded.
+
+    This is a range semi-join: for every access in the look-back period, EXISTS probes
+    the (building, access_timestamp) index for an infected access in
+    [access_timestamp - dwell, access_timestamp + dwell]. PostgreSQL typically drives it
+    from the handful of infected accesses instead, doing one index range scan per
+    building visit, so the cost follows the number of co-located rows rather than the
+    size of the table.
+    '''
+    end = infection.recorded_timestamp
+    start = end - STATUS_WINDOW
+    infected_accesses = Buildingaccess.objects.filter(
+        user_id=infection.user_id,
+        access_timestamp__range=(start, end),
+        building_id=OuterRef('building_id'),
+        access_timestamp__gte=OuterRef('access_timestamp') - dwell,
+        access_timestamp__lte=OuterRef('access_timestamp') + dwell,
+    )
+    return Buildingaccess.objects.filter(
+        Exists(infected_accesses),
+        access_timestamp__range=(start - dwell, end + dwell),
+    ).exclude(user_id=infection.user_id)
+
+
+def iter_exposures(infection: Infectionhistory, dwell: timedelta, chunk_size: int = 2000) -> Iterator[dict]:
+    '''
+    Streams co_located_accesses() as dicts, reading the rows in chunks (through a
+    server-side cursor on PostgreSQL) so the result never has to fit in memory.
+    '''
+    rows = co_located_accesses(infection, dwell).values_list('user_id', 'building_id', 'access_timestamp')
+    for user_id, building_id, access_timestamp in rows.iterator(chunk_size=chunk_size):
+        building = building_catalog.get(building_id)
+        yield {
+            'user': user_id,
+            'building': building_id,
+            'building_name': building.name if building else None,
+            'access_timestamp': access_timestamp,
+        }
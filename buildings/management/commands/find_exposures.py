@@ -0,0 +1,39 @@
+from datetime import timedelta
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from buildings.exposure import iter_exposures
+from contacts.models import Infectionhistory
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes the building accesses that overlapped an infected user\'s visits to '
+        'stdout, one JSON object per line.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('infection_id', type=int, help='Infectionhistory row to trace.')
+        parser.add_argument('--dwell-minutes', type=int, default=settings.EXPOSURE_DWELL_MINUTES, help='Largest gap between two accesses that counts as co-located.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        if options['dwell_minutes'] < 0:
+            raise CommandError('--dwell-minutes cannot be negative.')
+        try:
+            infection = Infectionhistory.objects.get(id=options['infection_id'])
+        except Infectionhistory.DoesNotExist:
+            raise CommandError(f'Infection {options["infection_id"]} does not exist.')
+
+        started = time.monotonic()
+        count = 0
+        users = set()
+        for exposure in iter_exposures(infection, timedelta(minutes=options['dwell_minutes']), options['chunk_size']):
+            self.stdout.write(json.dumps(exposure, cls=DjangoJSONEncoder))
+            users.add(exposure['user'])
+            count += 1
+        self.stderr.write(f'{count} co-located accesses by {len(users)} users in {time.monotonic() - started:.1f}s.')
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations
+
+from contacts.partitions import convert_to_partitioned
+
+
+def partition_buildingaccess(apps, schema_editor):
+    # Declarative partitioning is PostgreSQL only; other backends keep a plain table.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    convert_to_partitioned(schema_editor.connection, 'buildingaccess', settings.PARTITION_PRECREATE_WEEKS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0001_initial'),
+        ('contacts', '0003_partition_closecontacts'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_buildingaccess),
+    ]
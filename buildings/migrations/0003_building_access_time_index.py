@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0002_partition_buildingaccess'),
+    ]
+
+    # The composite index is created before the now redundant single-column
+    # building index is dropped.
+    operations = [
+        migrations.AddIndex(
+            model_name='buildingaccess',
+            index=models.Index(fields=['building', 'access_timestamp'], name='buildingaccess_building_ts_idx'),
+        ),
+        migrations.AlterField(
+            model_name='buildingaccess',
+            name='building',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='buildings.buildings'),
+        ),
+    ]
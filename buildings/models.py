@@ -5,12 +5,16 @@ import uuid
 # Create your models here.
 class Buildingaccess(models.Model):
     user = models.ForeignKey(Users, on_delete=models.CASCADE)
-    building = models.ForeignKey('Buildings', on_delete=models.CASCADE)
+    # Covered by the (building, access_timestamp) index below.
+    building = models.ForeignKey('Buildings', on_delete=models.CASCADE, db_index=False)
     access_timestamp = models.DateTimeField()
 
     class Meta:
         db_table = 'buildingaccess'
         unique_together = (('user', 'building', 'access_timestamp'),)
+        indexes = [
+            models.Index(fields=['building', 'access_timestamp'], name='buildingaccess_building_ts_idx'),
+        ]
 
 
 class Buildings(models.Model):
@@ -1,8 +1,24 @@
 from .models import Buildings,Buildingaccess
+from django.utils import timezone
 from rest_framework import serializers 
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# How far ahead of the server clock a gate's timestamps may be.
+MAX_CLOCK_SKEW = timedelta(minutes=5)
 
 class BuildingRegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Buildingaccess
         fields = '__all__'
+
+
+class BuildingAccessEventSerializer(serializers.Serializer):
+    """One tap replayed by a gate through the batch check-in endpoint."""
+    user = serializers.UUIDField()
+    building = serializers.UUIDField()
+    access_timestamp = serializers.DateTimeField()
+
+    def validate_access_timestamp(self, value):
+        if value > timezone.now() + MAX_CLOCK_SKEW:
+            raise serializers.ValidationError('access_timestamp is in the future')
+        return value
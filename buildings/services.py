@@ -0,0 +1,191 @@
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+import uuid
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from contacts.models import Infectionhistory, Users
+from contacts.status import recent_infections
+from .catalog import building_catalog
+from .models import Buildingaccess
+
+
+ACCESS_CREATED = 'created'
+ACCESS_DUPLICATE = 'duplicate'
+ACCESS_UNKNOWN_USER = 'unknown_user'
+ACCESS_UNKNOWN_BUILDING = 'unknown_building'
+
+
+class CheckIn(NamedTuple):
+    user_exists: bool
+    building_name: Optional[str]    # None if the building does not exist
+    infected: bool
+    created: bool
+
+
+def infection_window(now: datetime) -> tuple[datetime, datetime]:
+    # Infections from the start of the day 15 days ago up to the end of today.
+    return (
+        datetime.combine(date.today(), datetime.min.time(), now.tzinfo) - timedelta(days=15),
+        now.replace(hour=23, minute=59, second=59, microsecond=999999),
+    )
+
+
+def check_in_statement(connection, user_id, building_id: uuid.UUID, now: datetime) -> tuple[str, dict]:
+    '''
+    Returns the PostgreSQL statement (and its parameters) that check_in() runs.
+    '''
+    window_start, window_end = infection_window(now)
+    quote_name = connection.ops.quote_name
+    users = quote_name(Users._meta.db_table)
+    infectionhistory = quote_name(Infectionhistory._meta.db_table)
+    buildingaccess = quote_name(Buildingaccess._meta.db_table)
+    sql = f'''
+        WITH known_user AS (
+            SELECT id FROM {users} WHERE id = %(user)s
+        ), infection AS (
+            SELECT EXISTS (
+                SELECT 1 FROM {infectionhistory}
+                WHERE user_id = %(user)s AND recorded_timestamp BETWEEN %(window_start)s AND %(window_end)s
+            ) AS infected
+        ), inserted AS (
+            INSERT INTO {buildingaccess} (user_id, building_id, access_timestamp)
+            SELECT known_user.id, %(building)s, %(now)s
+            FROM known_user, infection
+            WHERE NOT infection.infected
+            ON CONFLICT (user_id, building_id, access_timestamp) DO NOTHING
+            RETURNING 1
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM known_user),
+            (SELECT infected FROM infection),
+            EXISTS (SELECT 1 FROM inserted)
+    '''
+    return sql, {
+        'user': user_id,
+        'building': building_id,
+        'window_start': window_start,
+        'window_end': window_end,
+        'now': now,
+    }
+
+
+def check_in(user_id, building_id, now: datetime = None, using: str = 'main_db') -> CheckIn:
+    '''
+    Records that the user entered the building at `now`, unless either does not exist
+    or the user has a recent infection (see infection_window()).
+
+    The building is looked up in the in-memory catalog, which is reloaded (rate
+    limited) if it does not know the building yet. On PostgreSQL the user and
+    infection checks and the INSERT are then one statement; elsewhere it takes one
+    query for the checks and one for the INSERT. Either way a duplicate tap at the same
+    instant is ignored rather than raising.
+    '''
+    now = now or timezone.now()
+    try:
+        building = building_catalog.get(uuid.UUID(str(building_id)), reload_on_miss=True)
+    except ValueError:
+        building = None
+    if building is None:
+        # Still tell an unknown user apart from an unknown building.
+        return CheckIn(user_exists=Users.objects.using(using).filter(id=user_id).exists(), building_name=None, infected=False, created=False)
+
+    connection = connections[using]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(*check_in_statement(connection, user_id, building.id, now))
+                user_exists, infected, created = cursor.fetchone()
+        else:
+            infected = Users.objects.using(using).filter(id=user_id).annotate(
+                infected=Exists(recent_infections(OuterRef('id'), *infection_window(now))),
+            ).values_list('infected', flat=True).first()
+            user_exists, infected = infected is not None, bool(infected)
+            created = user_exists and not infected
+            if created:
+                # ignore_conflicts cannot report whether the row was a duplicate.
+                Buildingaccess.objects.using(using).bulk_create(
+                    [Buildingaccess(user_id=user_id, building_id=building.id, access_timestamp=now)],
+                    ignore_conflicts=True,
+                )
+    except IntegrityError:
+        # The building was deleted since the catalog was loaded.
+        building_catalog.invalidate()
+        return CheckIn(user_exists=True, building_name=None, infected=False, created=False)
+    return CheckIn(user_exists=user_exists, building_name=building.name, infected=infected, created=created)
+
+
+def _insert_accesses(keys: list[tuple], using: str) -> set[tuple]:
+    '''
+    Inserts (user_id, building_id, access_timestamp) rows, skipping ones that already
+    exist, and returns the keys that were inserted.
+    '''
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        from psycopg2.extras import execute_values
+
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            inserted = execute_values(
+                cursor.cursor,
+                f'''
+                INSERT INTO {quote_name(Buildingaccess._meta.db_table)} (user_id, building_id, access_timestamp)
+                VALUES %s
+                ON CONFLICT (user_id, building_id, access_timestamp) DO NOTHING
+                RETURNING user_id, building_id, access_timestamp
+                ''',
+                keys,
+                page_size=1000,
+                fetch=True,
+            )
+        return set(inserted)
+
+    with transaction.atomic(using=using):
+        timestamps = [key[2] for key in keys]
+        existing = set(Buildingaccess.objects.using(using).filter(
+            user_id__in={key[0] for key in keys},
+            access_timestamp__range=(min(timestamps), max(timestamps)),
+        ).values_list('user_id', 'building_id', 'access_timestamp'))
+        new = [key for key in keys if key not in existing]
+        Buildingaccess.objects.using(using).bulk_create(
+            [Buildingaccess(user_id=user_id, building_id=building_id, access_timestamp=access_timestamp) for user_id, building_id, access_timestamp in new],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    return set(new)
+
+
+def record_accesses(events: list[dict], using: str = 'main_db') -> list[str]:
+    '''
+    Records many already validated taps (dicts with user, building and
+    access_timestamp) at once and returns one ACCESS_* status per event, in order.
+
+    Users are checked with one query and buildings against the catalog (reloaded, rate
+    limited, on an unknown building as in check_in()); the accepted
+    events are then inserted together, with events already recorded (or repeated in the
+    batch) reported as duplicates. Unlike check_in() there is no infection check: a
+    replayed tap records an entry that has already happened.
+    '''
+    if not events:
+        return []
+    known_users = set(Users.objects.using(using).filter(id__in={event['user'] for event in events}).values_list('id', flat=True))
+
+    statuses = [None] * len(events)
+    first_seen = {}
+    for index, event in enumerate(events):
+        key = (event['user'], event['building'], event['access_timestamp'])
+        if event['user'] not in known_users:
+            statuses[index] = ACCESS_UNKNOWN_USER
+        elif building_catalog.get(event['building'], reload_on_miss=True) is None:
+            statuses[index] = ACCESS_UNKNOWN_BUILDING
+        elif key in first_seen:
+            statuses[index] = ACCESS_DUPLICATE
+        else:
+            first_seen[key] = index
+
+    inserted = _insert_accesses(list(first_seen), using) if first_seen else set()
+    for key, index in first_seen.items():
+        statuses[index] = ACCESS_CREATED if key in inserted else ACCESS_DUPLICATE
+    return statuses
@@ -0,0 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import building_catalog
+from .models import Buildings
+
+
+@receiver([post_save, post_delete], sender=Buildings)
+def building_changed(sender, using, **kwargs):
+    transaction.on_commit(building_catalog.invalidate, using=using)
@@ -0,0 +1,79 @@
+from datetime import date
+import uuid
+
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from contacts.models import Infectionhistory, Users
+from .catalog import building_catalog
+from .models import Buildingaccess, Buildings
+from .services import check_in
+
+
+class CheckInTests(TestCase):
+    databases = {'default', 'main_db'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            id=uuid.uuid4(), nric='S0000001A', name='Test User', dob=date(1990, 1, 1),
+            phone='91234567', gender='F', address='1 Test Road', postal_code='100001',
+        )
+        cls.building = Buildings.objects.create(name='Main Hall', location=1)
+
+    def setUp(self):
+        # Load the catalog outside the counted queries.
+        building_catalog.invalidate()
+        building_catalog.all()
+        self.now = timezone.now()
+        # One statement on PostgreSQL; elsewhere the checks and the INSERT are separate.
+        self.check_in_queries = 1 if connections['main_db'].vendor == 'postgresql' else 2
+
+    def test_records_access(self):
+        with self.assertNumQueries(self.check_in_queries, using='main_db'):
+            result = check_in(self.user.id, self.building.id, self.now)
+
+        self.assertEqual(result, (True, 'Main Hall', False, True))
+        self.assertTrue(Buildingaccess.objects.filter(user=self.user, building=self.building, access_timestamp=self.now).exists())
+
+    def test_duplicate_tap_is_ignored(self):
+        check_in(self.user.id, self.building.id, self.now)
+        with self.assertNumQueries(self.check_in_queries, using='main_db'):
+            result = check_in(self.user.id, self.building.id, self.now)
+
+        self.assertEqual(result[:3], (True, 'Main Hall', False))
+        if connections['main_db'].vendor == 'postgresql':
+            # Elsewhere ignore_conflicts cannot report the duplicate.
+            self.assertFalse(result.created)
+        self.assertEqual(Buildingaccess.objects.count(), 1)
+
+    def test_infected_user_is_not_recorded(self):
+        Infectionhistory.objects.create(user=self.user, recorded_timestamp=self.now)
+        with self.assertNumQueries(1, using='main_db'):
+            result = check_in(self.user.id, self.building.id, self.now)
+
+        self.assertEqual(result, (True, 'Main Hall', True, False))
+        self.assertFalse(Buildingaccess.objects.exists())
+
+    def test_unknown_user(self):
+        with self.assertNumQueries(1, using='main_db'):
+            result = check_in(uuid.uuid4(), self.building.id, self.now)
+
+        self.assertEqual(result, (False, 'Main Hall', False, False))
+        self.assertFalse(Buildingaccess.objects.exists())
+
+    def test_unknown_building(self):
+        # The catalog was just loaded, so the miss does not reload it.
+        with self.assertNumQueries(1, using='main_db'):
+            result = check_in(self.user.id, uuid.uuid4(), self.now)
+
+        self.assertEqual(result, (True, None, False, False))
+
+    @override_settings(BUILDING_CATALOG_MISS_RELOAD_INTERVAL=0)
+    def test_building_added_elsewhere_is_found(self):
+        # bulk_create sends no signals, like a building written by another service.
+        building = Buildings.objects.bulk_create([Buildings(name='Annex', location=2)])[0]
+        result = check_in(self.user.id, building.id, self.now)
+
+        self.assertEqual(result, (True, 'Annex', False, True))
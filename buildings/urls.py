@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
-    BuildingAccessRegister
+    AsyncBuildingAccessRegister,
+    BuildingAccessBatchRegister,
+    BuildingAccessRegister,
+    InfectionExposures
 )
 
 app_name = 'infections'
 
 urlpatterns = [
-    path('register', BuildingAccessRegister.as_view()),
+    path('register', (AsyncBuildingAccessRegister if settings.ASYNC_VIEWS else BuildingAccessRegister).as_view()),
+    path('register/batch', BuildingAccessBatchRegister.as_view()),
+    path('exposures/<int:infection_id>', InfectionExposures.as_view()),
 ]
@@ -1,15 +1,24 @@
-from django.shortcuts import render
-from django.utils import timezone
-from .models import Buildings, Buildingaccess, Users
+from asgiref.sync import sync_to_async
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import CreateAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from datetime import date, datetime, timedelta
-from .serializers import BuildingRegisterSerializer
+from rest_framework.views import APIView
+from contacts.models import Infectionhistory
+from .exposure import iter_exposures
+from .serializers import BuildingAccessEventSerializer
+from .services import ACCESS_CREATED, CheckIn, check_in, record_accesses
+from accounts.async_views import AsyncAPIView
 
 
+import json
 import logging
 logger = logging.getLogger('loki')
 
@@ -18,28 +27,83 @@ class BuildingAccessRegister (CreateAPIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
+        result = check_in(request.user.id, request.data.get('building'))
+        return _check_in_response(request, result)
+
+
+def _check_in_response(request, result: CheckIn) -> Response:
+    if not result.user_exists:
+        raise ValidationError(detail="User does not exist")
+
+    logger.info('User accessed building.', extra={'action': 'building_access', 'request': request, 'user_id': request.user.id})
+    if result.building_name is None:
+        logger.warn('Building does not exist.', extra={'action': 'building_access', 'request': request, 'user_id': request.user.id})
+        raise ValidationError(detail="Building does not exist")
+
+    if result.infected:
+        return Response(data={'building_name': result.building_name, 'infected':True}, status=status.HTTP_200_OK)
+    return Response(data={'building_name': result.building_name, 'infected': False}, status=status.HTTP_201_CREATED)
+
+
+class AsyncBuildingAccessRegister(AsyncAPIView):
+    """ASGI variant of BuildingAccessRegister."""
+
+    permission_classes = (IsAuthenticated,)
+
+    async def post(self, request, *args, **kwargs):
+        result = await sync_to_async(check_in)(request.user.id, request.data.get('building'))
+        return _check_in_response(request, result)
+
+
+class BuildingAccessBatchRegister(APIView):
+    """
+    Records a batch of taps buffered by a gate while it was offline. Each event is
+    reported back as created, duplicate, invalid, unknown_user or unknown_building, in
+    the order it was sent, so the gate can drop everything it has delivered.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, *args, **kwargs):
+        events = request.data.get('events') if isinstance(request.data, dict) else None
+        if not isinstance(events, list) or not events:
+            raise ValidationError(detail="events must be a non-empty list")
+        if len(events) > settings.BUILDING_BATCH_MAX_EVENTS:
+            raise ValidationError(detail=f"At most {settings.BUILDING_BATCH_MAX_EVENTS} events can be sent at once")
+
+        results = [None] * len(events)
+        valid, positions = [], []
+        for index, event in enumerate(events):
+            serializer = BuildingAccessEventSerializer(data=event)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                results[index] = {'status': 'invalid', 'errors': serializer.errors}
+        for index, access_status in zip(positions, record_accesses(valid)):
+            results[index] = {'status': access_status}
+
+        counts = Counter(result['status'] for result in results)
+        logger.info('Recorded building access batch.', extra={'action': 'building_access_batch', 'request': request, 'user_id': request.user.id, 'results': dict(counts)})
+        return Response(data={'created': counts[ACCESS_CREATED], 'results': results}, status=status.HTTP_200_OK)
+
+
+class InfectionExposures(APIView):
+    """
+    Streams the building accesses that overlapped an infected user's visits, one JSON
+    object per line. The dwell window defaults to EXPOSURE_DWELL_MINUTES and can be set
+    with ?dwell_minutes=.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, infection_id, *args, **kwargs):
         try:
-            user = Users.objects.get(id=request.user.id)
-        except Users.DoesNotExist:
-            raise ValidationError(detail="User does not exist")
-            
-        logger.info('User accessed building.', extra={'action': 'building_access', 'request': request, 'user_id': request.user.id})
-        try:
-            building = Buildings.objects.get(id=request.data['building'])
-        except:
-            logger.warn('Building does not exist.', extra={'action': 'building_access', 'request': request, 'user_id': user.id})
-            raise ValidationError(detail="Building does not exist")
-            
-        infection = user.infectionhistory_set.filter( 
-            recorded_timestamp__range=(datetime.combine(date.today(), datetime.min.time(), timezone.now().tzinfo)-timedelta(days=15), timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999))
-            )
-        if infection.exists():
-            return Response(data={'building_name': building.name, 'infected':True}, status=status.HTTP_200_OK)
-
-        request.data['user'] = request.user.id
-        request.data['access_timestamp'] = timezone.now()
-        buildingaccess = BuildingRegisterSerializer(data=request.data)
-        buildingaccess.is_valid(raise_exception=True)
-        buildingaccess.save()
-
-        return Response(data={'building_name': building.name, 'infected': False}, status=status.HTTP_201_CREATED)
+            dwell_minutes = int(request.query_params.get('dwell_minutes', settings.EXPOSURE_DWELL_MINUTES))
+        except ValueError:
+            raise ValidationError(detail="dwell_minutes must be an integer")
+        if not 0 <= dwell_minutes <= 24 * 60:
+            raise ValidationError(detail="dwell_minutes must be between 0 and 1440")
+        infection = get_object_or_404(Infectionhistory, id=infection_id)
+
+        logger.info('Listed infection exposures.', extra={'action': 'infection_exposures', 'request': request, 'user_id': request.user.id})
+        lines = (json.dumps(exposure, cls=DjangoJSONEncoder) + '\n' for exposure in iter_exposures(infection, timedelta(minutes=dwell_minutes)))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
@@ -0,0 +1,15 @@
+from django.conf import settings
+
+# Backends whose entries live in the memory of a single process (or nowhere).
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured(alias: str = 'default') -> bool:
+    '''
+    Whether the cache `alias` is shared by every worker process, so that an entry
+    deleted or replaced by one worker is gone for all of them.
+    '''
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
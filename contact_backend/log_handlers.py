@@ -0,0 +1,11 @@
+from queue import Queue
+
+from logging_loki import LokiQueueHandler
+
+
+def loki_queue_handler(**kwargs) -> LokiQueueHandler:
+    """
+    Pushes log records to Loki from a background thread, so request handlers (and
+    the event loop under ASGI) never wait on the Loki HTTP push.
+    """
+    return LokiQueueHandler(Queue(-1), **kwargs)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,6 +27,14 @@ SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = (os.environ.get('DJANGO_DEBUG') == "True")
 
+# Route the contacts status/temp ID and building check-in endpoints to their native
+# async views. Only useful when served through ASGI (contact_backend.asgi).
+ASYNC_VIEWS = (os.environ.get('DJANGO_ASYNC_VIEWS') == "True")
+# Authenticate with the user details embedded in OTP-verified tokens instead of
+# loading the AuthUser on every request (see accounts.identity.OTPTokenUser). Needs a
+# shared cache, which holds the revocations of those details.
+STATELESS_TOKEN_USER = (os.environ.get('DJANGO_STATELESS_TOKEN_USER') == "True")
+
 # Vault client connection and initialization settings.
 # See https://hvac.readthedocs.io/en/stable/source/hvac_v1.html#hvac.v1.Client.__init__
 VAULT_SETTINGS = {
@@ -34,7 +43,59 @@ VAULT_SETTINGS = {
     'verify': False if DEBUG else os.environ.get('VAULT_ROOT_CA_FILE'),
     'cert': None if DEBUG else (os.environ.get('VAULT_CLIENT_CERT_FILE'), os.environ.get('VAULT_CLIENT_KEY_FILE')),
 }
+# Connections kept alive per worker process by the shared Vault client, and how
+# often (in seconds) its token is re-validated.
+VAULT_POOL_MAXSIZE = int(os.environ.get('VAULT_POOL_MAXSIZE', 10))
+VAULT_TOKEN_CHECK_INTERVAL = int(os.environ.get('VAULT_TOKEN_CHECK_INTERVAL', 60))
+# Seconds a Vault request may take before it is abandoned, by default and for the
+# operations on the login and upload paths (see accounts.vault.resilience).
+VAULT_TIMEOUT = float(os.environ.get('VAULT_TIMEOUT', 5))
+VAULT_OPERATION_TIMEOUTS = {
+    'auth.check': float(os.environ.get('VAULT_AUTH_CHECK_TIMEOUT', 2)),
+    'kv.read': float(os.environ.get('VAULT_KV_READ_TIMEOUT', 2)),
+    'totp.validate_code': float(os.environ.get('VAULT_TOTP_VALIDATE_TIMEOUT', 2)),
+}
+# Extra attempts for Vault reads that fail transiently, and the base in seconds of the
+# jittered exponential backoff between them.
+VAULT_READ_RETRIES = int(os.environ.get('VAULT_READ_RETRIES', 2))
+VAULT_RETRY_BACKOFF = float(os.environ.get('VAULT_RETRY_BACKOFF', 0.1))
+# Consecutive failed Vault calls that open the circuit breaker, and the seconds it then
+# fails calls immediately before letting a trial call through.
+VAULT_BREAKER_THRESHOLD = int(os.environ.get('VAULT_BREAKER_THRESHOLD', 5))
+VAULT_BREAKER_RESET = int(os.environ.get('VAULT_BREAKER_RESET', 30))
 VAULT_TEMP_ID_KEY_PATH = 'contacts/temp_id_key'
+# Seconds the temp ID key is kept in memory before it is re-read from Vault,
+# and how long before expiry a background refresh is started.
+TEMP_ID_KEY_TTL = int(os.environ.get('TEMP_ID_KEY_TTL', 300))
+TEMP_ID_KEY_REFRESH_AHEAD = int(os.environ.get('TEMP_ID_KEY_REFRESH_AHEAD', 30))
+# Number of 15 minute epochs returned by /contacts/temp_id by default, and the most
+# a client may request through ?epochs= (96 epochs = one day of prefetch).
+TEMP_ID_EPOCHS = 24
+TEMP_ID_MAX_EPOCHS = 96
+# Seconds a replaced temp ID key is still accepted for uploads: the 15 day contact
+# window, plus a day of prefetched temp IDs and the time workers keep the old key cached.
+TEMP_ID_KEY_RETENTION = int(os.environ.get('TEMP_ID_KEY_RETENTION', 16 * 24 * 3600 + TEMP_ID_KEY_TTL))
+# Uploads with at least this many distinct temp IDs are decrypted across a pool of worker
+# processes. Every web worker process has its own pool, so by default the cores are
+# split between the WEB_CONCURRENCY web workers (also gunicorn's worker count), at most
+# TEMP_ID_DECRYPT_MAX_WORKERS each. 1 decrypts inline, without a pool.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+TEMP_ID_DECRYPT_MAX_WORKERS = 4
+TEMP_ID_DECRYPT_WORKERS = int(os.environ.get(
+    'TEMP_ID_DECRYPT_WORKERS',
+    max(1, min(TEMP_ID_DECRYPT_MAX_WORKERS, (os.cpu_count() or 1) // WEB_CONCURRENCY)),
+))
+TEMP_ID_PARALLEL_MIN_RECORDS = int(os.environ.get('TEMP_ID_PARALLEL_MIN_RECORDS', 2000))
+# /contacts/upload bodies are streamed: records are decrypted and inserted this many at
+# a time, and bodies larger than TEMP_ID_UPLOAD_MAX_BYTES are rejected.
+TEMP_ID_UPLOAD_CHUNK_SIZE = int(os.environ.get('TEMP_ID_UPLOAD_CHUNK_SIZE', 5000))
+TEMP_ID_UPLOAD_MAX_BYTES = int(os.environ.get('TEMP_ID_UPLOAD_MAX_BYTES', 64 * 1024 * 1024))
+# closecontacts and buildingaccess are partitioned by week; manage_partitions keeps
+# this many weeks of partitions created ahead of the current one.
+PARTITION_PRECREATE_WEEKS = int(os.environ.get('PARTITION_PRECREATE_WEEKS', 4))
+# Close contacts, building accesses and notifications older than this many days are
+# removed by purge_expired_data. Must cover the 15 day contact tracing window.
+DATA_RETENTION_DAYS = int(os.environ.get('DATA_RETENTION_DAYS', 21))
 
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG
@@ -129,17 +190,62 @@ DATABASES = {
 DATABASE_ROUTERS = ['database_routers.default.DefaultRouter','database_routers.main.MainRouter']
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/ref/settings/#caches
+# Holds temp ID batches and per-user status. Defaults to per-process memory; point it at
+# a shared backend (e.g. django.core.cache.backends.redis.RedisCache) so invalidation
+# reaches every worker, or at FileBasedCache for tests.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+# Upper bound, in seconds, on how long a cached /contacts/status or
+# /contacts/upload/status answer is served before it is recomputed.
+STATUS_CACHE_TIMEOUT = int(os.environ.get('STATUS_CACHE_TIMEOUT', 3600))
+# Seconds a CLOSE or NEGATIVE status or a "no upload required" answer is cached.
+# Infections, close contacts and notifications are also written by other services and
+# by raw SQL, so no signal drops these when they change.
+STATUS_CACHE_SHORT_TIMEOUT = int(os.environ.get('STATUS_CACHE_SHORT_TIMEOUT', 30))
+# Seconds between checks of whether the in-memory building catalog is still current.
+BUILDING_CATALOG_CHECK_INTERVAL = int(os.environ.get('BUILDING_CATALOG_CHECK_INTERVAL', 5))
+# Seconds after which the building catalog is reloaded even if no write here changed
+# it, and the fewest seconds between reloads caused by an unknown building ID.
+BUILDING_CATALOG_MAX_AGE = int(os.environ.get('BUILDING_CATALOG_MAX_AGE', 300))
+BUILDING_CATALOG_MISS_RELOAD_INTERVAL = int(os.environ.get('BUILDING_CATALOG_MISS_RELOAD_INTERVAL', 10))
+# Seconds an authenticated user's AuthUser and Users rows are reused from the
+# per-process identity cache, i.e. how long another process may still accept a
+# deactivated user.
+IDENTITY_CACHE_TIMEOUT = int(os.environ.get('IDENTITY_CACHE_TIMEOUT', 30))
+# Cached identities kept per process before expired ones are swept out.
+IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES', 10000))
+# Most events a gate may send in one /buildings/register/batch request.
+BUILDING_BATCH_MAX_EVENTS = int(os.environ.get('BUILDING_BATCH_MAX_EVENTS', 5000))
+# Default dwell window, in minutes: users who accessed a building within this long of
+# an infected user are reported as exposed.
+EXPOSURE_DWELL_MINUTES = int(os.environ.get('EXPOSURE_DWELL_MINUTES', 30))
+
+
 # DEFAULT USER MODEL
 AUTH_USER_MODEL = 'accounts.AuthUser'
 
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'accounts.hashers.CalibratedArgon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.ScryptPasswordHasher',
 ]
 
+# Argon2 costs written by `manage.py calibrate_argon2`; Django's defaults are used
+# until the file exists.
+ARGON2_PROFILE = os.environ.get('ARGON2_PROFILE', BASE_DIR / 'argon2_profile.json')
+# Threads that hash passwords on login, and how many logins may wait for one before
+# the rest are turned away with a 503.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 2 * (os.cpu_count() or 1)))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -200,9 +306,14 @@ REST_FRAMEWORK = {
 # See https://django-rest-framework-simplejwt.readthedocs.io/en/latest/settings.html
 SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
-    'BLACKLIST_AFTER_ROTATION': True
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenUserRefreshSerializer',
 }
 
+# Lifetime of the access token returned by login, which is only good for registering
+# and validating the OTP.
+PRE_OTP_ACCESS_TOKEN_LIFETIME = timedelta(seconds=int(os.environ.get('PRE_OTP_ACCESS_TOKEN_LIFETIME', 300)))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': not DEBUG,
@@ -220,7 +331,7 @@ LOGGING = {
         },
         'loki': {
             'level': 'INFO',
-            'class': 'logging_loki.LokiHandler',
+            '()': 'contact_backend.log_handlers.loki_queue_handler',
             'url': 'https://logs-prod-011.grafana.net/loki/api/v1/push',
             'tags': {'app': 'contact-backend'},
             'auth': ('', '') if DEBUG else ('308685', os.environ['LOKI_PASSWD']),
@@ -0,0 +1,47 @@
+import csv
+import io
+
+from django.db import connections
+
+from .models import Closecontacts
+from .status import invalidate_status
+
+CLOSE_CONTACT_FIELDS = ('infected_user', 'contacted_user', 'contact_timestamp', 'rssi', 'infectionhistory')
+
+
+def bulk_insert_close_contacts(close_contacts: list[Closecontacts], using: str = 'main_db', batch_size: int = 1000) -> int:
+    '''
+    Inserts many Closecontacts rows at once and returns the number inserted.
+
+    On PostgreSQL the rows are streamed with a single COPY ... FROM STDIN (CSV), which
+    is one round-trip instead of one INSERT per row. Other backends fall back to
+    bulk_create(). Like COPY itself, this does not set primary keys on the instances
+    and does not send save signals; the contacted users' cached statuses are
+    invalidated directly instead.
+    '''
+    if not close_contacts:
+        return 0
+
+    invalidate_status((close_contact.contacted_user_id for close_contact in close_contacts), using=using)
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return len(Closecontacts.objects.using(using).bulk_create(close_contacts, batch_size=batch_size))
+
+    fields = [Closecontacts._meta.get_field(name) for name in CLOSE_CONTACT_FIELDS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for close_contact in close_contacts:
+        writer.writerow([
+            field.get_db_prep_save(getattr(close_contact, field.attname), connection)
+            for field in fields
+        ])
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote_name(Closecontacts._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+        return cursor.rowcount
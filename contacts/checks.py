@@ -0,0 +1,14 @@
+from django.core.checks import Tags, Warning, register
+
+from contact_backend.caches import shared_cache_configured
+
+
+@register(Tags.caches)
+def check_status_cache(app_configs, **kwargs):
+    if shared_cache_configured():
+        return []
+    return [Warning(
+        'The default cache is local to each process, so /contacts/status and /contacts/upload/status are not cached.',
+        hint='Set DJANGO_CACHE_BACKEND to a shared cache such as Redis or Memcached.',
+        id='contacts.W001',
+    )]
@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import AuthUser
+from accounts.vault import get_vault_client
+from buildings.views import AsyncBuildingAccessRegister, BuildingAccessRegister
+from contacts.utils import temp_id_key_provider
+from contacts.views import (
+    AsyncGenerateTemporaryIdsView,
+    AsyncGetInfectionStatusView,
+    AsyncGetUploadRequirementStatusView,
+    GenerateTemporaryIdsView,
+    GetInfectionStatusView,
+    GetUploadRequirementStatusView,
+)
+
+ENDPOINTS = {
+    'status': (GetInfectionStatusView, AsyncGetInfectionStatusView, 'get', '/contacts/status'),
+    'upload_status': (GetUploadRequirementStatusView, AsyncGetUploadRequirementStatusView, 'get', '/contacts/upload/status'),
+    'temp_id': (GenerateTemporaryIdsView, AsyncGenerateTemporaryIdsView, 'get', '/contacts/temp_id'),
+    'building_register': (BuildingAccessRegister, AsyncBuildingAccessRegister, 'post', '/buildings/register'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares how many concurrent requests the sync views (on a fixed number of worker '
+        'threads) and the async views (on one event loop) complete under injected Vault '
+        'and database latency. building_register writes rows; only run it against a '
+        'disposable database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='ID of the user to send the requests as.')
+        parser.add_argument('--building', help='Building ID, required for building_register.')
+        parser.add_argument('--endpoint', choices=ENDPOINTS.keys(), action='append')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads serving the sync views.')
+        parser.add_argument('--db-latency-ms', type=float, default=20)
+        parser.add_argument('--vault-latency-ms', type=float, default=50)
+        parser.add_argument('--cold-key', action='store_true', help='Drop the cached temp ID key before every request. Concurrent requests still share one Vault read.')
+
+    def handle(self, *args, **options):
+        user = AuthUser.objects.get(id=options['user'])
+        self._inject_latency(options['db_latency_ms'] / 1000, options['vault_latency_ms'] / 1000)
+        factory = APIRequestFactory()
+        count = options['requests']
+
+        for name in options['endpoint'] or ['status', 'upload_status', 'temp_id']:
+            sync_class, async_class, method, path = ENDPOINTS[name]
+            data = {'building': options['building']} if method == 'post' else None
+
+            def make_request():
+                if options['cold_key']:
+                    temp_id_key_provider.invalidate()
+                request = getattr(factory, method)(path, data, format='json')
+                force_authenticate(request, user=user)
+                return request
+
+            sync_view = sync_class.as_view()
+            def serve_sync(_):
+                return sync_view(make_request()).render().status_code
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as executor:
+                sync_statuses = list(executor.map(serve_sync, range(count)))
+            sync_elapsed = time.perf_counter() - start
+
+            async_view = async_class.as_view()
+            async def serve_async():
+                # Same per-request thread isolation as Django's ASGI handler.
+                async with ThreadSensitiveContext():
+                    return (await async_view(make_request())).render().status_code
+
+            async def serve_all_async():
+                return await asyncio.gather(*(serve_async() for _ in range(count)))
+
+            start = time.perf_counter()
+            async_statuses = asyncio.run(serve_all_async())
+            async_elapsed = time.perf_counter() - start
+
+            failed = sum(code >= 400 for code in sync_statuses + async_statuses)
+            if failed:
+                self.stderr.write(f'{name}: {failed} requests returned an error status')
+            self.stdout.write(
+                f'{name:>17}: sync ({options["threads"]} threads) {count / sync_elapsed:8.1f} req/s | '
+                f'async (1 loop) {count / async_elapsed:8.1f} req/s'
+            )
+
+    def _inject_latency(self, db_latency: float, vault_latency: float):
+        def delay_query(execute, sql, params, many, context):
+            time.sleep(db_latency)
+            return execute(sql, params, many, context)
+
+        def add_wrapper(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delay_query)
+
+        # Every thread opens its own connections; wrap those as they are created.
+        connection_created.connect(add_wrapper, weak=False)
+        for connection in connections.all():
+            connection.execute_wrappers.append(delay_query)
+
+        get_vault_client().session.hooks['response'].append(lambda response, *args, **kwargs: time.sleep(vault_latency))
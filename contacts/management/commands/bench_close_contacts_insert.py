@@ -0,0 +1,74 @@
+from datetime import timedelta
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from contacts.bulk import bulk_insert_close_contacts
+from contacts.models import Closecontacts, Infectionhistory, Users
+from contacts.serializers import CloseContactSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares rows per second of the close contact insert paths (per-row save, '
+        'bulk_create and COPY) against main_db. All rows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using='main_db'):
+                self._run(options['rows'], options['users'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, rows: int, user_count: int):
+        now = timezone.now()
+        users = Users.objects.bulk_create([
+            Users(id=uuid.uuid4(), nric=f'BENCH{uuid.uuid4().hex}', name='bench', dob=now.date(),
+                  phone='0', gender='-', address='-', postal_code='0')
+            for _ in range(user_count)
+        ])
+        infected = users[0]
+        infection = Infectionhistory.objects.create(user=infected, recorded_timestamp=now)
+        records = [{
+            'infected_user': infected.id,
+            'contacted_user': random.choice(users[1:]).id,
+            'contact_timestamp': now - timedelta(seconds=random.randrange(15 * 24 * 3600)),
+            'rssi': random.randrange(-100, 0),
+            'infectionhistory': infection.id,
+        } for _ in range(rows)]
+
+        serial = CloseContactSerializer(data=records, many=True)
+        serial.is_valid(raise_exception=True)
+        validated = serial.validated_data
+
+        def per_row_save():
+            for row in validated:
+                Closecontacts(**row).save()
+
+        def bulk_create():
+            Closecontacts.objects.bulk_create([Closecontacts(**row) for row in validated], batch_size=1000)
+
+        def copy():
+            bulk_insert_close_contacts([Closecontacts(**row) for row in validated])
+
+        for name, insert in (('per-row save', per_row_save), ('bulk_create', bulk_create), ('copy', copy)):
+            with transaction.atomic(using='main_db'):
+                start = time.perf_counter()
+                insert()
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True, using='main_db')
+            self.stdout.write(f'{name:>16}: {rows / elapsed:10.0f} rows/s ({elapsed:.2f}s for {rows} rows)')
@@ -0,0 +1,79 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from buildings.services import check_in_statement
+from contacts.status import (
+    active_upload_notification,
+    infection_status_query,
+    upload_status_query,
+)
+
+
+def hot_queries(connection, user_id, building_id):
+    '''
+    The queries run on every request by the contacts and buildings endpoints, built by
+    the same helpers the views use: querysets, or (sql, params) for raw statements.
+    '''
+    now = timezone.now()
+    return {
+        'contacts/status': infection_status_query(user_id, now),
+        'contacts/upload/status': upload_status_query(user_id, now.date()),
+        'contacts/upload (eligibility)': active_upload_notification(user_id, now),
+        'buildings/register': check_in_statement(connection, user_id, building_id, now),
+    }
+
+
+def _seq_scans(plan: dict):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan.get('Relation Name')
+    for child in plan.get('Plans', ()):
+        yield from _seq_scans(child)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the hot-path queries with sequential scans disabled and fails '
+        'if any of them still needs one, i.e. has no usable index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='main_db')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only failing ones.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'postgresql':
+            raise CommandError('check_query_plans needs PostgreSQL.')
+
+        failed = []
+        connection = connections[using]
+        # The IDs only need to be well formed; the plan does not depend on them matching a row.
+        queries = hot_queries(connection, uuid.uuid4(), uuid.uuid4())
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                # A sequential scan is then only chosen when no index can serve the query.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, query in queries.items():
+                if isinstance(query, tuple):
+                    # Plain EXPLAIN does not execute the statement, so nothing is inserted.
+                    sql, params = query
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                        plan = cursor.fetchone()[0][0]['Plan']
+                else:
+                    plan = json.loads(query.using(using).explain(format='json'))[0]['Plan']
+                tables = sorted(set(_seq_scans(plan)))
+                if tables:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(f'{name}: sequential scan on {", ".join(tables)}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+                if tables or options['verbose_plans']:
+                    self.stdout.write(json.dumps(plan, indent=2))
+
+        if failed:
+            raise CommandError(f'{len(failed)} hot path(s) fall back to a sequential scan: {", ".join(failed)}')
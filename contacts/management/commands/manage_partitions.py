@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from contacts.partitions import PARTITIONED_TABLES, ensure_upcoming_partitions, list_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the weekly closecontacts and buildingaccess partitions for the current week '
+        'and the next PARTITION_PRECREATE_WEEKS weeks. Run it at least weekly, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=settings.PARTITION_PRECREATE_WEEKS)
+        parser.add_argument('--database', default='main_db')
+        parser.add_argument('--list', action='store_true', help='List the existing partitions after creating.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Table partitioning needs PostgreSQL.')
+
+        for table in PARTITIONED_TABLES:
+            with transaction.atomic(using=options['database']):
+                created = ensure_upcoming_partitions(connection, table, options['weeks'])
+            for name in created:
+                self.stdout.write(f'Created {name}')
+            if options['list']:
+                for name, start, end in list_partitions(connection, table):
+                    self.stdout.write(f'{name}: {start:%Y-%m-%d} to {end:%Y-%m-%d}')
+        self.stdout.write(self.style.SUCCESS('Partitions are up to date.'))
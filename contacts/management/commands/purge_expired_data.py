@@ -0,0 +1,174 @@
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from buildings.models import Buildingaccess
+from contacts.models import Closecontacts, Infectionhistory, Notifications
+from contacts.partitions import drop_partition, list_partitions
+from contacts.status import STATUS_WINDOW
+
+
+class Command(BaseCommand):
+    help = (
+        'Removes close contacts, building accesses and notifications older than '
+        'DATA_RETENTION_DAYS. Expired weekly partitions are dropped whole; remaining rows '
+        'are deleted in short batches in timestamp order, each in its own transaction. '
+        'Notifications without a due date go once their infection is that old.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.DATA_RETENTION_DAYS, help='Retention in days.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause after each non-empty batch.')
+        parser.add_argument('--lock-timeout', default='5s', help='Give up on a partition drop that waits longer than this for its lock.')
+        parser.add_argument('--database', default='main_db')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be removed.')
+
+    def handle(self, *args, **options):
+        if timedelta(days=options['days']) < STATUS_WINDOW:
+            raise CommandError(f'Retention must cover the {STATUS_WINDOW.days} day status window.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        using = options['database']
+        connection = connections[using]
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        targets = [
+            (Closecontacts, 'contact_timestamp', cutoff),
+            (Buildingaccess, 'access_timestamp', cutoff),
+            # Notifications only matter until their due date; those without one are
+            # removed with their infection's age below.
+            (Notifications, 'due_date', cutoff.date()),
+        ]
+
+        total = 0
+        for model, field_name, table_cutoff in targets:
+            started = time.monotonic()
+            table = model._meta.db_table
+            column = model._meta.get_field(field_name).column
+
+            dropped = dropped_rows = 0
+            if connection.vendor == 'postgresql':
+                for name, start, end in list_partitions(connection, table):
+                    if end > cutoff:
+                        break
+                    if options['dry_run']:
+                        dropped_rows += self._count(connection, name, column, table_cutoff)
+                    else:
+                        with transaction.atomic(using=using):
+                            with connection.cursor() as cursor:
+                                cursor.execute('SELECT set_config(%s, %s, true)', ['lock_timeout', options['lock_timeout']])
+                            dropped_rows += drop_partition(connection, table, name)
+                    dropped += 1
+
+            if options['dry_run']:
+                deleted, batches = self._count(connection, table, column, table_cutoff) - dropped_rows, 0
+            else:
+                deleted, batches = self._delete_in_batches(connection, model, column, table_cutoff, options)
+
+            removed = dropped_rows + deleted
+            total += removed
+            self.stdout.write(
+                f'{table}: {"would remove" if options["dry_run"] else "removed"} {removed} rows ({dropped} partitions dropped, '
+                f'{deleted} rows deleted in {batches} batches) in {time.monotonic() - started:.1f}s'
+            )
+
+        undated = self._delete_undated_notifications(connection, cutoff, options)
+        total += undated
+        self.stdout.write(f'{Notifications._meta.db_table}: {"would remove" if options["dry_run"] else "removed"} {undated} rows without a due date')
+
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} rows older than {cutoff:%Y-%m-%d %H:%M}.'))
+
+    def _count(self, connection, table: str, column: str, cutoff) -> int:
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {quote_name(table)} WHERE {quote_name(column)} < %s', [cutoff])
+            return cursor.fetchone()[0]
+
+    def _delete_in_batches(self, connection, model, column: str, cutoff, options) -> tuple[int, int]:
+        '''
+        Deletes the expired rows of `model` and returns (rows deleted, batches run).
+
+        Rows are walked in (timestamp, primary key) order, --batch-size at a time, each
+        batch ending at the key of its last row. Primary keys need not follow the
+        timestamps (an upload inserts contacts from the past two weeks at once), so
+        batching on them could make every batch scan the whole table. Rows are removed
+        with plain DELETEs, without model signals: expired rows are outside every status
+        window, so no cache is affected.
+        '''
+        quote_name = connection.ops.quote_name
+        table = quote_name(model._meta.db_table)
+        pk = quote_name(model._meta.pk.column)
+        column = quote_name(column)
+
+        deleted = batches = 0
+        after = None
+        while True:
+            condition, params = f'{column} < %s', [cutoff]
+            if after is not None:
+                condition += f' AND ({column}, {pk}) > (%s, %s)'
+                params += after
+            # One short transaction per batch keeps row locks and each WAL burst bounded.
+            with transaction.atomic(using=options['database']):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT {column}, {pk} FROM {table} WHERE {condition} ORDER BY {column}, {pk} LIMIT 1 OFFSET %s',
+                        params + [options['batch_size'] - 1],
+                    )
+                    last = cursor.fetchone()
+                    if last is None:
+                        # Fewer than a batch left.
+                        cursor.execute(f'DELETE FROM {table} WHERE {condition}', params)
+                    else:
+                        cursor.execute(f'DELETE FROM {table} WHERE {condition} AND ({column}, {pk}) <= (%s, %s)', params + list(last))
+                    count = cursor.rowcount
+            deleted += count
+            batches += bool(count)
+            if last is None:
+                return deleted, batches
+            after = list(last)
+            if count and options['sleep']:
+                time.sleep(options['sleep'])
+
+    def _delete_undated_notifications(self, connection, cutoff, options) -> int:
+        '''
+        Deletes notifications without a due date whose infection was recorded before the
+        cutoff, in batches of --batch-size, and returns how many were deleted. With
+        options['dry_run'] it only counts them.
+        '''
+        quote_name = connection.ops.quote_name
+        notifications = quote_name(Notifications._meta.db_table)
+        infection_id = quote_name(Notifications._meta.pk.column)
+        undated = f'''
+            SELECT n.{infection_id} FROM {notifications} n
+            JOIN {quote_name(Infectionhistory._meta.db_table)} i ON i.{quote_name(Infectionhistory._meta.pk.column)} = n.{infection_id}
+            WHERE n.{quote_name(Notifications._meta.get_field('due_date').column)} IS NULL
+            AND i.{quote_name(Infectionhistory._meta.get_field('recorded_timestamp').column)} < %s
+        '''
+        if options['dry_run']:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM ({undated}) undated', [cutoff])
+                return cursor.fetchone()[0]
+
+        deleted, after = 0, None
+        while True:
+            with transaction.atomic(using=options['database']):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'{undated} AND n.{infection_id} > %s ORDER BY n.{infection_id} LIMIT %s',
+                        [cutoff, -1 if after is None else after, options['batch_size']],
+                    )
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if not ids:
+                        return deleted
+                    cursor.execute(
+                        f'DELETE FROM {notifications} WHERE {infection_id} IN ({", ".join(["%s"] * len(ids))})',
+                        ids,
+                    )
+                    deleted += cursor.rowcount
+            after = ids[-1]
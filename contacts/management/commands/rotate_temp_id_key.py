@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from contacts.utils import temp_id_key_provider
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a new temporary ID key and stores it in Vault. Running workers '
+        'pick up the new key once their cached copy expires (TEMP_ID_KEY_TTL). Temp IDs '
+        'issued under the old key are accepted for TEMP_ID_KEY_RETENTION seconds.'
+    )
+
+    def handle(self, *args, **options):
+        temp_id_key_provider.rotate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rotated temporary ID key. Workers will use it within {settings.TEMP_ID_KEY_TTL} seconds.'
+        ))
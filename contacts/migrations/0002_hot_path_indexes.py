@@ -0,0 +1,29 @@
+# Generated by Django 4.1.2 on 2026-10-18 12:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0001_initial'),
+    ]
+
+    # The composite index is created before the now redundant single-column
+    # contacted_user index is dropped.
+    operations = [
+        migrations.AddIndex(
+            model_name='closecontacts',
+            index=models.Index(fields=['contacted_user', 'contact_timestamp'], name='closecontacts_contacted_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(condition=models.Q(('uploaded_status', False)), fields=['infection', 'due_date', 'start_date'], name='notifications_pending_idx'),
+        ),
+        migrations.AlterField(
+            model_name='closecontacts',
+            name='contacted_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='contacted_user', to='contacts.users'),
+        ),
+    ]
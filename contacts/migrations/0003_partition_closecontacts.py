@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.db import migrations
+
+from contacts.partitions import convert_to_partitioned
+
+
+def partition_closecontacts(apps, schema_editor):
+    # Declarative partitioning is PostgreSQL only; other backends keep a plain table.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    convert_to_partitioned(schema_editor.connection, 'closecontacts', settings.PARTITION_PRECREATE_WEEKS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_closecontacts),
+    ]
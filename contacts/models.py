@@ -3,13 +3,17 @@ from django.db import models
 # Create your models here.
 class Closecontacts(models.Model):
     infected_user = models.ForeignKey('Users', on_delete=models.CASCADE, related_name="infected_user")
-    contacted_user = models.ForeignKey('Users', on_delete=models.CASCADE, related_name="contacted_user")
+    # Covered by the (contacted_user, contact_timestamp) index below.
+    contacted_user = models.ForeignKey('Users', on_delete=models.CASCADE, related_name="contacted_user", db_index=False)
     contact_timestamp = models.DateTimeField()
     rssi = models.DecimalField(max_digits=10, decimal_places=2)
     infectionhistory = models.ForeignKey('Infectionhistory', on_delete=models.CASCADE)
 
     class Meta:
         db_table = 'closecontacts'
+        indexes = [
+            models.Index(fields=['contacted_user', 'contact_timestamp'], name='closecontacts_contacted_ts_idx'),
+        ]
 
 
 class Contacttracers(models.Model):
@@ -37,6 +41,9 @@ class Notifications(models.Model):
 
     class Meta:
         db_table = 'notifications'
+        indexes = [
+            models.Index(fields=['infection', 'due_date', 'start_date'], name='notifications_pending_idx', condition=models.Q(uploaded_status=False)),
+        ]
 
 
 class Users(models.Model):
@@ -0,0 +1,154 @@
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+READ_SIZE = 64 * 1024
+
+# Characters that can continue a JSON number.
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'payload_too_large'
+
+
+class _JSONStream():
+    '''
+    Incremental reader over a JSON document that keeps at most one read chunk
+    plus one partially decoded value in memory.
+    '''
+
+    def __init__(self, stream, max_bytes: int):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._bytes_read = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(READ_SIZE)
+        self._bytes_read += len(chunk)
+        if self._bytes_read > self._max_bytes:
+            raise PayloadTooLarge()
+        try:
+            text = self._decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        '''
+        Returns the next non-whitespace character without consuming it, or '' at the end.
+        '''
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def next_char(self) -> str:
+        char = self.peek()
+        self._pos += len(char)
+        return char
+
+    def expect(self, char: str):
+        if self.next_char() != char:
+            raise ParseError(f'JSON parse error - expected "{char}".')
+
+    def value(self):
+        '''
+        Decodes the next complete JSON value, reading more of the stream as needed.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+                # A number may continue in the next chunk, also where the buffer ends in
+                # a partial fraction or exponent ('1.', '2e') that raw_decode stops before.
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self._eof or not number or self._buffer[end:].strip(NUMBER_CHARS):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as exc:
+                if self._eof:
+                    raise ParseError(f'JSON parse error - {exc}')
+            self._fill()
+
+
+def iter_json_list(stream, key: str, max_bytes: int):
+    '''
+    Yields the items of the list stored under `key` in a top level JSON object, one at
+    a time, without loading the whole document. Other keys are parsed and discarded.
+    '''
+    reader = _JSONStream(stream, max_bytes)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.next_char()
+    else:
+        while True:
+            name = reader.value()
+            if not isinstance(name, str):
+                raise ParseError('JSON parse error - object keys must be strings.')
+            reader.expect(':')
+            if name != key:
+                reader.value()
+            elif reader.peek() != '[':
+                raise ParseError(f'"{key}" must be a list.')
+            else:
+                reader.next_char()
+                if reader.peek() == ']':
+                    reader.next_char()
+                else:
+                    while True:
+                        yield reader.value()
+                        separator = reader.next_char()
+                        if separator == ']':
+                            break
+                        if separator != ',':
+                            raise ParseError('JSON parse error - expected "," or "]".')
+
+            separator = reader.next_char()
+            if separator == '}':
+                break
+            if separator != ',':
+                raise ParseError('JSON parse error - expected "," or "}".')
+
+    if reader.peek() != '':
+        raise ParseError('JSON parse error - unexpected data after the JSON object.')
+
+
+class TempIdUploadParser(BaseParser):
+    '''
+    Parses a temp ID upload lazily: `temp_ids` is returned as an iterator that reads
+    the request body as it is consumed, so uploads are never held in memory whole.
+    Bodies larger than TEMP_ID_UPLOAD_MAX_BYTES are rejected with a 413.
+    '''
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_bytes = settings.TEMP_ID_UPLOAD_MAX_BYTES
+        request = (parser_context or {}).get('request')
+        if request is not None:
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            if content_length > max_bytes:
+                raise PayloadTooLarge()
+        return {'temp_ids': iter_json_list(stream, 'temp_ids', max_bytes)}
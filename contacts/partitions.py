@@ -0,0 +1,189 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+# Append-only tables that are range partitioned by week on their timestamp column.
+PARTITIONED_TABLES = {
+    'closecontacts': 'contact_timestamp',
+    'buildingaccess': 'access_timestamp',
+}
+
+PARTITION_SPAN = timedelta(weeks=1)
+
+
+def week_start(moment: datetime) -> datetime:
+    '''
+    Returns the start (Monday 00:00 UTC) of the week partition containing `moment`.
+    '''
+    day = moment.astimezone(dt_timezone.utc).date()
+    return datetime.combine(day - timedelta(days=day.weekday()), time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f'{table}_p{start:%Y%m%d}'
+
+
+def default_partition_name(table: str) -> str:
+    return f'{table}_default'
+
+
+def list_partitions(connection, table: str) -> list[tuple[str, datetime, datetime]]:
+    '''
+    Returns (name, start, end) for every weekly partition of `table`, oldest first.
+    The default partition is not included.
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND child.relname <> %s
+            ORDER BY child.relname
+            ''',
+            [table, default_partition_name(table)],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        start = datetime.strptime(name[len(table) + 2:], '%Y%m%d').replace(tzinfo=dt_timezone.utc)
+        partitions.append((name, start, start + PARTITION_SPAN))
+    return partitions
+
+
+def ensure_partition(connection, table: str, start: datetime) -> bool:
+    '''
+    Creates the weekly partition of `table` starting at `start` unless it already
+    exists, and returns whether it was created. Rows for that week that already landed
+    in the default partition are moved into the new partition.
+    '''
+    column = PARTITIONED_TABLES[table]
+    name = partition_name(table, start)
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        # CREATE TABLE ... PARTITION OF fails if the default partition holds rows for the
+        # new range, so build the partition detached, move the rows, then attach it.
+        cursor.execute(f'CREATE TABLE {quote_name(name)} (LIKE {quote_name(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'''
+            WITH moved AS (
+                DELETE FROM {quote_name(default_partition_name(table))}
+                WHERE {quote_name(column)} >= %s AND {quote_name(column)} < %s
+                RETURNING *
+            )
+            INSERT INTO {quote_name(name)} SELECT * FROM moved
+            ''',
+            [start, start + PARTITION_SPAN],
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote_name(table)} ATTACH PARTITION {quote_name(name)} FOR VALUES FROM (%s) TO (%s)',
+            [start, start + PARTITION_SPAN],
+        )
+    return True
+
+
+def ensure_upcoming_partitions(connection, table: str, weeks: int, now: datetime = None) -> list[str]:
+    '''
+    Makes sure partitions exist from the current week through `weeks` weeks ahead and
+    returns the names of the ones created.
+    '''
+    start = week_start(now or timezone.now())
+    created = []
+    for week in range(weeks + 1):
+        if ensure_partition(connection, table, start + week * PARTITION_SPAN):
+            created.append(partition_name(table, start + week * PARTITION_SPAN))
+    return created
+
+
+def drop_partition(connection, table: str, name: str) -> int:
+    '''
+    Detaches and drops one partition of `table`, returning the number of rows it held.
+    '''
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {quote_name(name)}')
+        rows = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE {quote_name(table)} DETACH PARTITION {quote_name(name)}')
+        cursor.execute(f'DROP TABLE {quote_name(name)}')
+    return rows
+
+
+def convert_to_partitioned(connection, table: str, weeks_ahead: int):
+    '''
+    Rebuilds `table` as a table range partitioned by week on its timestamp column,
+    keeping its columns, constraints, index names and rows.
+
+    The primary key becomes (id, <timestamp>) because PostgreSQL requires the partition
+    key in every unique constraint; ids still come from a single sequence. Rows outside
+    every weekly partition go to a default partition, so inserts never fail.
+    '''
+    column = PARTITIONED_TABLES[table]
+    old = f'{table}_unpartitioned'
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('u', 'f')
+            ''',
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table])
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            '''
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE tablename = %s
+            AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+            ''',
+            [table, table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            f'SELECT min({quote_name(column)}) FROM {quote_name(table)}'
+        )
+        oldest = cursor.fetchone()[0]
+
+        # Free the original names for the new table.
+        cursor.execute(f'ALTER TABLE {quote_name(table)} RENAME TO {quote_name(old)}')
+        cursor.execute(f'ALTER TABLE {quote_name(old)} RENAME CONSTRAINT {quote_name(primary_key)} TO {quote_name(old + "_pkey")}')
+        for name, _ in constraints:
+            cursor.execute(f'ALTER TABLE {quote_name(old)} RENAME CONSTRAINT {quote_name(name)} TO {quote_name(name[:59] + "_old")}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {quote_name(name)} RENAME TO {quote_name(name[:59] + "_old")}')
+        # Partitioned tables cannot have identity columns, so ids come from a plain
+        # sequence. Release the old one (identity or serial) so its name can be reused.
+        cursor.execute(f'ALTER TABLE {quote_name(old)} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [old, 'id'])
+        serial_sequence = cursor.fetchone()[0]
+        if serial_sequence is not None:
+            cursor.execute(f'ALTER TABLE {quote_name(old)} ALTER COLUMN id DROP DEFAULT')
+            cursor.execute(f'DROP SEQUENCE {serial_sequence}')
+
+        cursor.execute(f'CREATE TABLE {quote_name(table)} (LIKE {quote_name(old)}) PARTITION BY RANGE ({quote_name(column)})')
+        sequence = f'{table}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {quote_name(sequence)} AS bigint OWNED BY {quote_name(table)}.id')
+        cursor.execute(f"ALTER TABLE {quote_name(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {quote_name(table)} ADD CONSTRAINT {quote_name(table + "_pkey")} PRIMARY KEY (id, {quote_name(column)})')
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {quote_name(table)} ADD CONSTRAINT {quote_name(name)} {definition}')
+        for _, definition in indexes:
+            # Captured before the rename, so these still point at the original table name.
+            cursor.execute(definition)
+
+        cursor.execute(f'CREATE TABLE {quote_name(default_partition_name(table))} PARTITION OF {quote_name(table)} DEFAULT')
+        now = timezone.now()
+        start = week_start(oldest or now)
+        while start <= week_start(now):
+            ensure_partition(connection, table, start)
+            start += PARTITION_SPAN
+        ensure_upcoming_partitions(connection, table, weeks_ahead, now)
+
+        cursor.execute(f'INSERT INTO {quote_name(table)} SELECT * FROM {quote_name(old)}')
+        cursor.execute(f"SELECT setval('{sequence}', COALESCE(max(id), 0) + 1, false) FROM {quote_name(table)}")
+        cursor.execute(f'DROP TABLE {quote_name(old)}')
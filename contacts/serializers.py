@@ -6,12 +6,64 @@ from .models import (
     )
 from rest_framework import exceptions, serializers 
 
+from .bulk import bulk_insert_close_contacts
+
+class CloseContactRowSerializer(serializers.ModelSerializer):
+    """Validate the fields of one CloseContact without looking up its foreign keys."""
+
+    infected_user = serializers.UUIDField(source='infected_user_id')
+    contacted_user = serializers.UUIDField(source='contacted_user_id')
+    infectionhistory = serializers.IntegerField(source='infectionhistory_id')
+
+    class Meta:
+        model = Closecontacts
+        fields = ('infected_user', 'contacted_user', 'contact_timestamp', 'rssi', 'infectionhistory')
+
+
+class CloseContactListSerializer(serializers.ListSerializer):
+    """
+    Handle many CloseContact objects at once.
+
+    Foreign keys are checked with one IN (...) query per referenced model instead of
+    one query per key per row. Rows whose contacted user does not exist are dropped
+    and counted in `dropped`; an unknown infected user or infection is an error.
+    Saving inserts all rows with bulk_insert_close_contacts().
+    """
+
+    dropped = 0
+
+    def to_internal_value(self, data):
+        rows = CloseContactRowSerializer(data=data, many=True)
+        rows.is_valid(raise_exception=True)
+        rows = rows.validated_data
+
+        user_ids = {row['infected_user_id'] for row in rows} | {row['contacted_user_id'] for row in rows}
+        infection_ids = {row['infectionhistory_id'] for row in rows}
+        known_users = set(Users.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        known_infections = set(Infectionhistory.objects.filter(id__in=infection_ids).values_list('id', flat=True))
+
+        if not {row['infected_user_id'] for row in rows} <= known_users:
+            raise exceptions.ValidationError({'infected_user': ['Invalid pk - object does not exist.']})
+        if not infection_ids <= known_infections:
+            raise exceptions.ValidationError({'infectionhistory': ['Invalid pk - object does not exist.']})
+
+        validated = [row for row in rows if row['contacted_user_id'] in known_users]
+        self.dropped = len(rows) - len(validated)
+        return validated
+
+    def create(self, validated_data):
+        close_contacts = [Closecontacts(**row) for row in validated_data]
+        bulk_insert_close_contacts(close_contacts)
+        return close_contacts
+
+
 class CloseContactSerializer(serializers.ModelSerializer):
     """Handle serialization and deserialization of CloseContact objects."""
 
     class Meta:
         model = Closecontacts
         fields = '__all__'
+        list_serializer_class = CloseContactListSerializer
     
 
 class UserSerializer(serializers.ModelSerializer[Users]):
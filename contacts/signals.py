@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Closecontacts, Infectionhistory, Notifications
+from .status import invalidate_status
+
+
+@receiver([post_save, post_delete], sender=Infectionhistory)
+def infection_history_changed(sender, instance, using, **kwargs):
+    invalidate_status([instance.user_id], using=using)
+
+
+@receiver([post_save, post_delete], sender=Closecontacts)
+def close_contact_changed(sender, instance, using, **kwargs):
+    invalidate_status([instance.contacted_user_id], using=using)
+
+
+@receiver([post_save, post_delete], sender=Notifications)
+def notification_changed(sender, instance, using, **kwargs):
+    # Notifications are deleted before the infection they cascade from, so the
+    # infection row is still there to look the user up.
+    user_id = Infectionhistory.objects.using(using).filter(id=instance.infection_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_status([user_id], using=using)
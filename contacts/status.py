@@ -0,0 +1,183 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from contact_backend.caches import shared_cache_configured
+from .models import Closecontacts, Infectionhistory, Notifications, Users
+
+POSITIVE = 'positive'
+CLOSE = 'close'
+NEGATIVE = 'negative'
+
+# How far back an infection or a close contact still affects a user's status.
+STATUS_WINDOW = timedelta(days=15)
+
+
+def _infection_status_key(user_id) -> str:
+    return f'status:infection:{user_id}'
+
+
+def _upload_status_key(user_id) -> str:
+    return f'status:upload:{user_id}'
+
+
+def infection_status_query(user_id, now: datetime):
+    window = (now - STATUS_WINDOW, now)
+    latest_infection = Infectionhistory.objects.filter(
+        user_id=OuterRef('id'), recorded_timestamp__range=window,
+    ).order_by('-recorded_timestamp').values('recorded_timestamp')[:1]
+    latest_close_contact = Closecontacts.objects.filter(
+        contacted_user_id=OuterRef('id'), contact_timestamp__range=window,
+    ).order_by('-contact_timestamp').values('contact_timestamp')[:1]
+    return Users.objects.filter(id=user_id).annotate(
+        latest_infection=Subquery(latest_infection),
+        latest_close_contact=Subquery(latest_close_contact),
+    ).values_list('latest_infection', 'latest_close_contact')
+
+
+def recent_infections(user_id, start: datetime, end: datetime):
+    return Infectionhistory.objects.filter(user_id=user_id, recorded_timestamp__range=(start, end))
+
+
+def active_upload_notification(user_id, now: datetime):
+    '''
+    The notification asking the user to upload their close contacts: the one for their
+    latest infection within STATUS_WINDOW, if it is still pending and not past its due
+    date, latest due date first. The row is locked FOR UPDATE, so this must be
+    evaluated inside a main_db transaction.
+    '''
+    latest_infection = recent_infections(user_id, now - STATUS_WINDOW, now).order_by('-recorded_timestamp').values('id')[:1]
+    return Notifications.objects.select_for_update(of=('self',)).filter(
+        infection_id=Subquery(latest_infection), uploaded_status=False, due_date__gte=now.date(),
+    ).order_by('-due_date')
+
+
+def _to_status(row, now: datetime) -> tuple[str, int]:
+    '''
+    Returns the status for a row of infection_status_query() together with the number
+    of seconds it may be cached: until the row that decided it leaves the window, and
+    for CLOSE and NEGATIVE, which a new infection elsewhere changes, at most
+    STATUS_CACHE_SHORT_TIMEOUT.
+    '''
+    # No users row means there can be no infection or close contact either.
+    latest_infection, latest_close_contact = row or (None, None)
+    if latest_infection is not None:
+        status, expires, timeout = POSITIVE, latest_infection + STATUS_WINDOW, settings.STATUS_CACHE_TIMEOUT
+    elif latest_close_contact is not None:
+        status, expires, timeout = CLOSE, latest_close_contact + STATUS_WINDOW, settings.STATUS_CACHE_SHORT_TIMEOUT
+    else:
+        return NEGATIVE, settings.STATUS_CACHE_SHORT_TIMEOUT
+    return status, max(1, min(timeout, int((expires - now).total_seconds())))
+
+
+def resolve_infection_status(user_id, now: datetime = None) -> str:
+    '''
+    Returns POSITIVE if the user was recorded infected within STATUS_WINDOW, CLOSE if
+    they were a close contact of an infected user within it, and NEGATIVE otherwise.
+    Both checks are subqueries of a single statement. Always reads the database; see
+    get_infection_status() for the cached version.
+    '''
+    now = now or timezone.now()
+    return _to_status(infection_status_query(user_id, now).first(), now)[0]
+
+
+async def aresolve_infection_status(user_id, now: datetime = None) -> str:
+    '''
+    Async version of resolve_infection_status().
+    '''
+    now = now or timezone.now()
+    return _to_status(await infection_status_query(user_id, now).afirst(), now)[0]
+
+
+def get_infection_status(user_id) -> str:
+    '''
+    Cached resolve_infection_status(). Entries are dropped when the user's infection
+    history or close contacts change (see invalidate_status()) and expire when the
+    infection or contact they are based on leaves the window. CLOSE and NEGATIVE are
+    only cached for STATUS_CACHE_SHORT_TIMEOUT seconds, as infections and contacts are
+    also recorded elsewhere.
+
+    Nothing is cached unless the cache is shared by all workers: invalidate_status()
+    could not reach the other workers' entries.
+    '''
+    if not shared_cache_configured():
+        return resolve_infection_status(user_id)
+    status = cache.get(_infection_status_key(user_id))
+    if status is None:
+        now = timezone.now()
+        status, timeout = _to_status(infection_status_query(user_id, now).first(), now)
+        cache.set(_infection_status_key(user_id), status, timeout)
+    return status
+
+
+async def aget_infection_status(user_id) -> str:
+    '''
+    Async version of get_infection_status().
+    '''
+    if not shared_cache_configured():
+        return await aresolve_infection_status(user_id)
+    status = await cache.aget(_infection_status_key(user_id))
+    if status is None:
+        now = timezone.now()
+        status, timeout = _to_status(await infection_status_query(user_id, now).afirst(), now)
+        await cache.aset(_infection_status_key(user_id), status, timeout)
+    return status
+
+
+def upload_status_query(user_id, today: date):
+    return Notifications.objects.filter(infection__user_id=user_id, start_date__lte=today, due_date__gte=today, uploaded_status=False)
+
+
+def _upload_status_timeout(required: bool, now: datetime) -> int:
+    # Notification dates are compared against now().date(), so roll over at UTC midnight.
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    timeout = settings.STATUS_CACHE_TIMEOUT if required else settings.STATUS_CACHE_SHORT_TIMEOUT
+    return max(1, min(timeout, int((tomorrow - now).total_seconds())))
+
+
+def get_upload_requirement_status(user_id) -> bool:
+    '''
+    Returns whether the user has a pending upload request, cached until the user's
+    notifications change or the date rolls over. A False answer is only cached for
+    STATUS_CACHE_SHORT_TIMEOUT seconds, as notifications are created elsewhere.
+    Like get_infection_status(), it is not cached unless the cache is shared.
+    '''
+    if not shared_cache_configured():
+        return upload_status_query(user_id, timezone.now().date()).exists()
+    required = cache.get(_upload_status_key(user_id))
+    if required is None:
+        now = timezone.now()
+        required = upload_status_query(user_id, now.date()).exists()
+        cache.set(_upload_status_key(user_id), required, _upload_status_timeout(required, now))
+    return required
+
+
+async def aget_upload_requirement_status(user_id) -> bool:
+    '''
+    Async version of get_upload_requirement_status().
+    '''
+    if not shared_cache_configured():
+        return await upload_status_query(user_id, timezone.now().date()).aexists()
+    required = await cache.aget(_upload_status_key(user_id))
+    if required is None:
+        now = timezone.now()
+        required = await upload_status_query(user_id, now.date()).aexists()
+        await cache.aset(_upload_status_key(user_id), required, _upload_status_timeout(required, now))
+    return required
+
+
+def invalidate_status(user_ids, using: str = 'main_db'):
+    '''
+    Drops the cached statuses of the given users once the current transaction on
+    `using` commits (immediately when there is none), so a concurrent request cannot
+    cache the state from before the write.
+    '''
+    keys = []
+    for user_id in set(user_ids):
+        keys += [_infection_status_key(user_id), _upload_status_key(user_id)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
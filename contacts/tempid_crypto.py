@@ -0,0 +1,99 @@
+'''
+Temp ID encryption and decryption.
+
+Deliberately free of Django imports: the upload decrypt pool's spawned workers import
+this module to unpickle _decrypt_temp_id_values, before (and without) setting up
+Django.
+'''
+from base64 import b64decode, b64encode
+from typing import Optional
+import struct
+import time
+import uuid
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+
+EPOCH_SECONDS = 15 * 60
+NONCE_SIZE = 12     # 96 bit / 12 byte IV
+_PLAINTEXT = struct.Struct('>16sII')   # uuid_bytes (16 bytes) || start_time (4 bytes) || end_time (4 bytes)
+
+
+def current_epoch_start(now: float = None) -> int:
+    '''
+    Returns the Unix timestamp of the 15 minute epoch boundary at or before now.
+    '''
+    now = time.time() if now is None else now
+    return int(now) // EPOCH_SECONDS * EPOCH_SECONDS
+
+
+def generate_temp_ids(uuid: uuid.UUID, key: bytes, epochs: int = 24, start: int = None) -> list[str]:
+    '''
+    Generates a list of temporary IDs for a given user ID, one per 15 minute epoch.
+
+    The temporary IDs are generated by encrypting the user ID with AES-256 in GCM mode.
+    All nonces are drawn from the RNG in a single call and the epoch boundaries are
+    computed as integer Unix timestamps.
+    Epochs are aligned to 15 minute boundaries, starting at `start` (defaults to the
+    current epoch).
+    '''
+    # temp id format:
+    #
+    # b64encode(
+    #   Encrypt(
+    #       uuid_bytes (16 bytes) || start_time (4 bytes) || end_time (4 bytes)
+    #   ) (24 bytes) ||
+    #   nonce (12 bytes) ||
+    #   tag (16 bytes)
+    # )
+    #
+    # Encrypt with AES-GCM
+    # https://pycryptodome.readthedocs.io/en/latest/src/cipher/modern.html#gcm-mode
+    uuid_bytes = uuid.bytes
+    first_epoch_start = current_epoch_start() if start is None else start
+    epoch_starts = range(first_epoch_start, first_epoch_start + epochs * EPOCH_SECONDS, EPOCH_SECONDS)
+
+    random_bytes = get_random_bytes(NONCE_SIZE * epochs)
+    nonces = [random_bytes[i:i + NONCE_SIZE] for i in range(0, len(random_bytes), NONCE_SIZE)]
+
+    temp_ids = []
+    for start, nonce in zip(epoch_starts, nonces):
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(_PLAINTEXT.pack(uuid_bytes, start, start + EPOCH_SECONDS))
+        temp_ids.append({
+            'temp_id': b64encode(ciphertext + nonce + tag).decode('ascii'),     # 52 bytes -> 72 characters
+            'start': start,
+            'end': start + EPOCH_SECONDS,
+        })
+
+    return temp_ids, first_epoch_start + epochs * EPOCH_SECONDS
+
+
+def _decrypt_temp_id_value(temp_id: str, keys: list[bytes]) -> Optional[tuple[uuid.UUID, int, int]]:
+    '''
+    Decrypts one temp ID string into (owner UUID, epoch start, epoch end), or None if
+    it is not a valid temp ID under any of the keys. Keys are tried in order, so the
+    current key should come first.
+    '''
+    try:
+        temp_id_bytes = b64decode(temp_id)
+    except:
+        return None
+    ciphertext = temp_id_bytes[:24]
+    nonce = temp_id_bytes[24:36]
+    tag = temp_id_bytes[36:]
+
+    for key in keys:
+        try:
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+            plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+            uuid_bytes, epoch_start, epoch_end = _PLAINTEXT.unpack(plaintext)
+            return uuid.UUID(bytes=uuid_bytes), epoch_start, epoch_end
+        except:
+            continue
+    return None
+
+
+def _decrypt_temp_id_values(temp_ids: list[str], keys: list[bytes]) -> dict[str, Optional[tuple[uuid.UUID, int, int]]]:
+    return {temp_id: _decrypt_temp_id_value(temp_id, keys) for temp_id in temp_ids}
@@ -0,0 +1,270 @@
+from base64 import b64decode
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+import io
+import struct
+import uuid
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError, ValidationError
+
+from .parsers import PayloadTooLarge, iter_json_list
+from .serializers import CloseContactSerializer
+from .status import CLOSE, NEGATIVE, POSITIVE, _to_status
+from buildings.models import Buildingaccess, Buildings
+from . import utils
+from .models import Closecontacts, Infectionhistory, Notifications, Users
+from .utils import EPOCH_SECONDS, decrypt_temp_ids, generate_temp_ids
+
+
+class GenerateTempIdsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.key = get_random_bytes(32)
+        self.user_id = uuid.uuid4()
+        self.start = 1_700_000_100 // EPOCH_SECONDS * EPOCH_SECONDS
+
+    def test_matches_aes_gcm(self):
+        temp_ids, end = generate_temp_ids(self.user_id, self.key, epochs=4, start=self.start)
+
+        self.assertEqual(len(temp_ids), 4)
+        self.assertEqual(end, self.start + 4 * EPOCH_SECONDS)
+        for i, temp_id in enumerate(temp_ids):
+            epoch_start = self.start + i * EPOCH_SECONDS
+            self.assertEqual((temp_id['start'], temp_id['end']), (epoch_start, epoch_start + EPOCH_SECONDS))
+
+            raw = b64decode(temp_id['temp_id'])
+            self.assertEqual(len(raw), 52)
+            nonce = raw[24:36]
+            plaintext = self.user_id.bytes + struct.pack('>II', epoch_start, epoch_start + EPOCH_SECONDS)
+            ciphertext, tag = AES.new(self.key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(plaintext)
+            self.assertEqual(raw, ciphertext + nonce + tag)
+
+    def test_nonces_are_distinct(self):
+        temp_ids, _ = generate_temp_ids(self.user_id, self.key, epochs=96, start=self.start)
+        nonces = {b64decode(temp_id['temp_id'])[24:36] for temp_id in temp_ids}
+        self.assertEqual(len(nonces), 96)
+
+
+class IterJsonListTests(SimpleTestCase):
+
+    def parse(self, body: bytes, read_size: int) -> list:
+        with mock.patch('contacts.parsers.READ_SIZE', read_size):
+            return list(iter_json_list(io.BytesIO(body), 'temp_ids', max_bytes=len(body)))
+
+    def test_values_split_across_reads(self):
+        body = b'{"x": 1.5, "y": [2e-3, true], "temp_ids": [{"temp_id": "a\\u00e9", "rssi": -50.25}, 12, -0.5e+2]}'
+        expected = [{'temp_id': 'aé', 'rssi': -50.25}, 12, -50.0]
+        for read_size in range(1, len(body) + 1):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(self.parse(body, read_size), expected)
+
+    def test_rejects_malformed_body(self):
+        for body in (b'{"temp_ids": [1 2]}', b'{"temp_ids": {}}', b'{"temp_ids": [1]} []', b'{"temp_ids": [1.]}'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(body, 4)
+
+    def test_rejects_body_over_limit(self):
+        with self.assertRaises(PayloadTooLarge):
+            list(iter_json_list(io.BytesIO(b'{"temp_ids": []}'), 'temp_ids', max_bytes=8))
+
+
+class DecryptTempIdsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.key = get_random_bytes(32)
+        self.owner = uuid.uuid4()
+        self.uploader = uuid.uuid4()
+        self.temp_ids, _ = generate_temp_ids(self.owner, self.key, epochs=4)
+
+    def sightings(self) -> list[dict]:
+        return [{'temp_id': temp_id['temp_id'], 'contact_timestamp': temp_id['start'] + 60, 'rssi': -60} for temp_id in self.temp_ids]
+
+    def test_accepts_valid_sightings(self):
+        other_key_ids, _ = generate_temp_ids(self.owner, get_random_bytes(32), epochs=1)
+        own_ids, _ = generate_temp_ids(self.uploader, self.key, epochs=1)
+        first = self.temp_ids[0]
+        records = self.sightings() + [
+            {'temp_id': first['temp_id'], 'rssi': -60},
+            {'temp_id': other_key_ids[0]['temp_id'], 'contact_timestamp': first['start'], 'rssi': -60},
+            {'temp_id': first['temp_id'], 'contact_timestamp': first['end'] + 1, 'rssi': -60},
+            {'temp_id': own_ids[0]['temp_id'], 'contact_timestamp': own_ids[0]['start'], 'rssi': -60},
+        ]
+        accepted, rejected = decrypt_temp_ids(records, [self.key], self.uploader, 7)
+
+        self.assertEqual([record['temp_id'] for record in accepted], [temp_id['temp_id'] for temp_id in self.temp_ids])
+        self.assertEqual(
+            {(record['infected_user'], record['contacted_user'], record['infectionhistory']) for record in accepted},
+            {(self.uploader, self.owner, 7)},
+        )
+        self.assertEqual(rejected, Counter({
+            utils.REJECT_MALFORMED: 1,
+            utils.REJECT_INVALID_TEMP_ID: 1,
+            utils.REJECT_OUTSIDE_EPOCH: 1,
+            utils.REJECT_SELF_CONTACT: 1,
+        }))
+
+    def test_accepts_temp_ids_under_previous_key(self):
+        keyring = [get_random_bytes(32), self.key]
+        accepted, rejected = decrypt_temp_ids(self.sightings(), keyring, self.uploader, 7)
+
+        self.assertEqual(len(accepted), 4)
+        self.assertFalse(rejected)
+
+    @override_settings(TEMP_ID_DECRYPT_WORKERS=2, TEMP_ID_PARALLEL_MIN_RECORDS=1)
+    def test_process_pool_matches_inline(self):
+        self.addCleanup(lambda: utils._discard_decrypt_executor(utils._get_decrypt_executor()))
+        records = self.sightings() + [{'temp_id': 'invalid', 'contact_timestamp': 0, 'rssi': -60}]
+        accepted, rejected = decrypt_temp_ids(records, [self.key], self.uploader, 7)
+
+        self.assertEqual(len(accepted), 4)
+        self.assertEqual(rejected, Counter({utils.REJECT_INVALID_TEMP_ID: 1}))
+
+    def test_repeated_temp_ids_are_decrypted_once(self):
+        records = [record for _ in range(50) for record in self.sightings()]
+        decrypted = {}
+        with mock.patch('contacts.utils._decrypt_temp_id_values', wraps=utils._decrypt_temp_id_values) as decrypt:
+            accepted, _ = decrypt_temp_ids(records[:100], [self.key], self.uploader, 7, decrypted)
+            accepted += decrypt_temp_ids(records[100:], [self.key], self.uploader, 7, decrypted)[0]
+
+        self.assertEqual(len(accepted), 200)
+        decrypt.assert_called_once()
+        self.assertCountEqual(decrypt.call_args.args[0], [temp_id['temp_id'] for temp_id in self.temp_ids])
+
+
+def create_user(nric: str) -> Users:
+    return Users.objects.create(
+        id=uuid.uuid4(), nric=nric, name='Test User', dob=date(1990, 1, 1),
+        phone='91234567', gender='F', address='1 Test Road', postal_code='100001',
+    )
+
+
+class CloseContactListSerializerTests(TestCase):
+    databases = {'default', 'main_db'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.infected = create_user('S0000001A')
+        cls.contacts = [create_user(f'S00001{i:02}B') for i in range(20)]
+        cls.infection = Infectionhistory.objects.create(user=cls.infected, recorded_timestamp=timezone.now())
+
+    def rows(self, contacted_users) -> list[dict]:
+        return [{
+            'infected_user': self.infected.id,
+            'contacted_user': contacted_user,
+            'contact_timestamp': timezone.now(),
+            'rssi': -60,
+            'infectionhistory': self.infection.id,
+        } for contacted_user in contacted_users]
+
+    def test_checks_foreign_keys_in_one_query_per_model(self):
+        serializer = CloseContactSerializer(data=self.rows([user.id for user in self.contacts]), many=True)
+        with self.assertNumQueries(2, using='main_db'):
+            serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(Closecontacts.objects.filter(infectionhistory=self.infection).count(), 20)
+
+    def test_drops_unknown_contacted_users(self):
+        serializer = CloseContactSerializer(data=self.rows([self.contacts[0].id, uuid.uuid4()]), many=True)
+        serializer.is_valid(raise_exception=True)
+
+        self.assertEqual(serializer.dropped, 1)
+        self.assertEqual([row['contacted_user_id'] for row in serializer.validated_data], [self.contacts[0].id])
+
+    def test_rejects_unknown_infected_user_or_infection(self):
+        for field, value in (('infected_user', uuid.uuid4()), ('infectionhistory', self.infection.id + 1)):
+            rows = self.rows([self.contacts[0].id])
+            rows[0][field] = value
+            serializer = CloseContactSerializer(data=rows, many=True)
+            with self.subTest(field=field), self.assertRaises(ValidationError):
+                serializer.is_valid(raise_exception=True)
+
+
+class PurgeExpiredDataTests(TestCase):
+    databases = {'default', 'main_db'}
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.old, cls.recent = now - timedelta(days=30), now - timedelta(days=1)
+        infected, contacted = create_user('S0000001A'), create_user('S0000002A')
+        building = Buildings.objects.create(name='Main Hall', location=1)
+        for timestamp in (cls.old, cls.recent):
+            infection = Infectionhistory.objects.create(user=infected, recorded_timestamp=timestamp)
+            Notifications.objects.create(infection=infection, start_date=timestamp.date(), due_date=timestamp.date(), uploaded_status=False)
+            for offset in range(3):
+                contact_timestamp = timestamp + timedelta(minutes=offset)
+                Closecontacts.objects.create(
+                    infected_user=infected, contacted_user=contacted, contact_timestamp=contact_timestamp,
+                    rssi=-60, infectionhistory=infection,
+                )
+                Buildingaccess.objects.create(user=contacted, building=building, access_timestamp=contact_timestamp)
+
+    def purge(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command('purge_expired_data', '--sleep', '0', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_removes_rows_older_than_retention(self):
+        self.purge('--batch-size', '2')
+
+        self.assertQuerysetEqual(Closecontacts.objects.values_list('contact_timestamp__date', flat=True).distinct(), [self.recent.date()])
+        self.assertQuerysetEqual(Buildingaccess.objects.values_list('access_timestamp__date', flat=True).distinct(), [self.recent.date()])
+        self.assertQuerysetEqual(Notifications.objects.values_list('due_date', flat=True), [self.recent.date()])
+
+    def test_batches_follow_timestamps_not_primary_keys(self):
+        # Uploaded last: the oldest contact has the highest primary key.
+        contact = Closecontacts.objects.filter(contact_timestamp=self.old).get()
+        late_upload = Closecontacts.objects.create(
+            infected_user=contact.infected_user, contacted_user=contact.contacted_user,
+            contact_timestamp=self.old - timedelta(days=1), rssi=-60, infectionhistory=contact.infectionhistory,
+        )
+        self.purge('--batch-size', '2')
+
+        self.assertFalse(Closecontacts.objects.filter(pk=late_upload.pk).exists())
+        self.assertEqual(Closecontacts.objects.count(), 3)
+
+    def test_removes_old_notifications_without_due_date(self):
+        user = Users.objects.get(nric='S0000001A')
+        for timestamp in (self.old, self.recent):
+            infection = Infectionhistory.objects.create(user=user, recorded_timestamp=timestamp + timedelta(hours=1))
+            Notifications.objects.create(infection=infection, uploaded_status=False)
+        self.purge('--batch-size', '1')
+
+        self.assertQuerysetEqual(
+            Notifications.objects.filter(due_date__isnull=True).values_list('infection__recorded_timestamp', flat=True),
+            [self.recent + timedelta(hours=1)],
+        )
+
+    def test_dry_run_only_counts(self):
+        output = self.purge('--dry-run')
+
+        self.assertIn('Would remove 7 rows', output)
+        self.assertEqual(Closecontacts.objects.count(), 6)
+
+    def test_rejects_retention_shorter_than_status_window(self):
+        with self.assertRaises(CommandError):
+            self.purge('--days', '7')
+
+
+@override_settings(STATUS_CACHE_TIMEOUT=3600, STATUS_CACHE_SHORT_TIMEOUT=30)
+class StatusCacheTimeoutTests(SimpleTestCase):
+
+    def test_only_positive_is_cached_long(self):
+        now = timezone.now()
+        recent = now - timedelta(days=1)
+        self.assertEqual(_to_status((recent, recent), now), (POSITIVE, 3600))
+        self.assertEqual(_to_status((None, recent), now), (CLOSE, 30))
+        self.assertEqual(_to_status(None, now), (NEGATIVE, 30))
+
+    def test_expires_when_the_deciding_row_leaves_the_window(self):
+        now = timezone.now()
+        leaving = now - timedelta(days=15) + timedelta(seconds=10)
+        self.assertEqual(_to_status((leaving, None), now), (POSITIVE, 10))
+        self.assertEqual(_to_status((None, leaving), now), (CLOSE, 10))
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
+    AsyncGenerateTemporaryIdsView,
+    AsyncGetInfectionStatusView,
+    AsyncGetUploadRequirementStatusView,
     GenerateTemporaryIdsView,
     UploadTemporaryIdsView,
     GetInfectionStatusView,
@@ -11,9 +15,9 @@ from .views import (
 app_name = 'contacts'
 
 urlpatterns = [
-    path('temp_id', GenerateTemporaryIdsView.as_view()),
+    path('temp_id', (AsyncGenerateTemporaryIdsView if settings.ASYNC_VIEWS else GenerateTemporaryIdsView).as_view()),
     path('upload', UploadTemporaryIdsView.as_view()),
-    path('upload/status', GetUploadRequirementStatusView.as_view()),
-    path('status', GetInfectionStatusView.as_view()),
+    path('upload/status', (AsyncGetUploadRequirementStatusView if settings.ASYNC_VIEWS else GetUploadRequirementStatusView).as_view()),
+    path('status', (AsyncGetInfectionStatusView if settings.ASYNC_VIEWS else GetInfectionStatusView).as_view()),
     path('user', UserRetrieveUpdateAPIView.as_view()),
 ]
\ No newline at end of file
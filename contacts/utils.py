@@ -1,124 +1,392 @@
-from base64 import b64decode, b64encode
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from typing import Optional
+import hashlib
+import multiprocessing
+import threading
+import time
 import uuid
-from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 from hvac import Client
+from hvac.exceptions import InvalidPath, InvalidRequest
 
-def _generate_and_store_key(vault_client: Client, path: str) -> bytes:
+from accounts.vault import get_vault_client
+from accounts.vault.resilience import call_vault
+from .tempid_crypto import (
+    EPOCH_SECONDS,
+    current_epoch_start,
+    generate_temp_ids,
+    _decrypt_temp_id_value,
+    _decrypt_temp_id_values
+)
+
+import logging
+logger = logging.getLogger('loki')
+
+def _generate_and_store_key(vault_client: Client, path: str, cas: Optional[int] = None) -> bytes:
     new_key = get_random_bytes(32)
-    vault_client.secrets.kv.v2.create_or_update_secret(
+    call_vault(
+        'kv.write',
+        vault_client.secrets.kv.v2.create_or_update_secret,
         path=path,
         secret={'key': new_key.hex()},
+        cas=cas,
     )
     return new_key
 
+def _read_secret_key(vault_client: Client, path: str, version: Optional[int] = None) -> bytes:
+    key = call_vault('kv.read', vault_client.secrets.kv.v2.read_secret_version, path=path, version=version, idempotent=True)
+    try:
+        return bytes.fromhex(key['data']['data']['key'])
+    except (TypeError, KeyError, ValueError):
+        # Never overwrite a secret we cannot read: data encrypted under it would be lost.
+        raise ValueError(f'The Vault secret at {path} does not hold a valid key')
+
 def get_or_generate_secret_key(vault_client: Client, path: str) -> bytes:
     '''
-    Gets a secret key from Vault, or generates a new one if it doesn't exist.
+    Gets a secret key from Vault, or generates a new one if none has been stored yet.
+
+    Only a missing secret (InvalidPath) leads to a new key; Vault being unreachable or
+    refusing the read raises instead. The new key is written with check-and-set, so if
+    another process stores one first, that key is read back and used.
     '''
     try:
-        key = vault_client.secrets.kv.v2.read_secret_version(path=path)
-        if key is None or 'data' not in key or 'data' not in key['data'] or 'key' not in key['data']['data']:
-            raise Exception('No key found')
-        return bytes.fromhex(key["data"]["data"]["key"])
-    except Exception as e:
-        print(e)
-        return _generate_and_store_key(vault_client, path)
+        return _read_secret_key(vault_client, path)
+    except InvalidPath:
+        pass
+    try:
+        return _generate_and_store_key(vault_client, path, cas=0)
+    except InvalidRequest:
+        # check-and-set failed: the secret exists now.
+        return _read_secret_key(vault_client, path)
+
+
+class TempIdKeyProvider():
+    '''
+    Keeps the temporary ID keyring in memory for the lifetime of the process.
 
+    The keyring is the current key followed by the earlier versions of the Vault
+    secret that were replaced within the last TEMP_ID_KEY_RETENTION seconds: temp IDs
+    handed out under them can still be uploaded after a rotation. New temp IDs are only
+    generated with the current key.
 
-def generate_temp_ids(uuid: uuid.UUID, key: bytes) -> list[str]:
+    Vault is only contacted when the cached keyring expires (after TEMP_ID_KEY_TTL
+    seconds) or is rotated. Once the keyring is within TEMP_ID_KEY_REFRESH_AHEAD
+    seconds of expiring, it is reloaded on a background thread while the
+    current one keeps being served.
     '''
-    Generates a list of temporary IDs for a given user ID.
 
-    The temporary IDs are generated by encrypting the user ID with AES-256 in GCM mode.
+    def __init__(self, path: str = None, client_factory=get_vault_client):
+        self._path = path
+        self._client_factory = client_factory
+        self._lock = threading.Lock()
+        self._keys = None
+        self._versions = {}
+        self.key_id = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.rotations = 0
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.VAULT_TEMP_ID_KEY_PATH
+
+    def get_key(self) -> bytes:
+        '''
+        Returns the current key, the one new temp IDs are generated with.
+        '''
+        return self.get_keys()[0]
+
+    def get_keys(self) -> list[bytes]:
+        '''
+        Returns the cached keyring, current key first, loading it from Vault if it is
+        missing or expired.
+        '''
+        keys, expires_at = self._keys, self._expires_at
+        now = time.monotonic()
+        if keys is not None and now < expires_at:
+            self.hits += 1
+            if now >= expires_at - settings.TEMP_ID_KEY_REFRESH_AHEAD:
+                self._refresh_in_background()
+            return keys
+
+        with self._lock:
+            # Another thread may have loaded the keyring while we were waiting.
+            if self._keys is not None and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._keys
+            self.misses += 1
+            return self._load()
+
+    def rotate(self) -> bytes:
+        '''
+        Generates a new key, stores it in Vault and starts serving it immediately. The
+        replaced key stays in the keyring for TEMP_ID_KEY_RETENTION seconds.
+        '''
+        with self._lock:
+            vault_client = self._client_factory()
+            key = _generate_and_store_key(vault_client, self.path)
+            self.rotations += 1
+            self._store(key, self._previous_keys(vault_client))
+            logger.info('Rotated temporary ID key.', extra={'action': 'rotate_temp_id_key', 'generation': self.generation})
+            return key
+
+    def invalidate(self):
+        '''
+        Forces the next call to get_keys() to reload the keyring from Vault.
+        '''
+        with self._lock:
+            self._expires_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'rotations': self.rotations,
+            'generation': self.generation,
+            'keys': len(self._keys) if self._keys is not None else 0,
+            'expires_in': max(0.0, self._expires_at - time.monotonic()) if self._keys is not None else 0.0,
+        }
+
+    def _load(self) -> list[bytes]:
+        # Must be called with self._lock held.
+        vault_client = self._client_factory()
+        key = get_or_generate_secret_key(vault_client, self.path)
+        self._store(key, self._previous_keys(vault_client))
+        return self._keys
+
+    def _previous_keys(self, vault_client: Client) -> list[bytes]:
+        '''
+        Returns the versions of the secret before the current one that were replaced
+        less than TEMP_ID_KEY_RETENTION seconds ago, newest first. Deleted and destroyed
+        versions are skipped. Old versions never change, so each is read only once.
+        '''
+        metadata = call_vault('kv.read', vault_client.secrets.kv.v2.read_secret_metadata, path=self.path, idempotent=True)['data']
+        versions = metadata['versions']
+        cutoff = timezone.now() - timedelta(seconds=settings.TEMP_ID_KEY_RETENTION)
+
+        keys = {}
+        for version in range(metadata['current_version'] - 1, 0, -1):
+            # A version was in use until the next one was written.
+            successor = versions.get(str(version + 1))
+            if successor is None or parse_datetime(successor['created_time']) < cutoff:
+                break
+            info = versions.get(str(version))
+            if info is None or info['destroyed'] or info['deletion_time']:
+                continue
+            key = self._versions.get(version)
+            if key is None:
+                key = _read_secret_key(vault_client, self.path, version=version)
+            keys[version] = key
+        self._versions = keys
+        return list(keys.values())
+
+    def _store(self, key: bytes, previous_keys: list[bytes]):
+        if self._keys is None or key != self._keys[0]:
+            self.generation += 1
+            # Non-secret identifier of the key, safe to use in cache keys.
+            self.key_id = hashlib.sha256(b'temp_id_key_id:' + key).hexdigest()[:16]
+        # A rotation racing the metadata read can list the current key as a previous one.
+        self._keys = [key] + [previous for previous in previous_keys if previous != key]
+        self._expires_at = time.monotonic() + settings.TEMP_ID_KEY_TTL
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._load()
+                self.refreshes += 1
+        except Exception as e:
+            # Keep serving the current key until it expires; get_key() will
+            # retry synchronously after that.
+            logger.warn('Failed to refresh temporary ID key.', extra={'action': 'refresh_temp_id_key', 'exception': e.__class__.__name__})
+        finally:
+            self._refreshing = False
+
+
+temp_id_key_provider = TempIdKeyProvider()
+
+
+def get_temp_ids(user_id: uuid.UUID, epochs: int = 24):
+    '''
+    Returns the temp ID batch for the user's current 15 minute window.
+
+    A batch is generated once per (user, window, epochs, key) and cached until the
+    window ends, so repeated or retried polls within a window get the same batch.
+    '''
+    key = temp_id_key_provider.get_key()
+    window_start = current_epoch_start()
+    cache_key = f'temp_ids:{user_id}:{window_start}:{epochs}:{temp_id_key_provider.key_id}'
+
+    batch = cache.get(cache_key)
+    if batch is None:
+        batch = generate_temp_ids(user_id, key, epochs, start=window_start)
+        cache.set(cache_key, batch, timeout=max(1, window_start + EPOCH_SECONDS - int(time.time())))
+    return batch
+
+
+def chunked(iterable, size: int):
+    '''
+    Yields lists of at most `size` items from any iterable, consuming it lazily.
     '''
-    uuid_bytes = uuid.bytes
-    temp_ids = []
-    epoch_start = timezone.now() - timedelta(seconds=30)
-    epoch_end = epoch_start + timedelta(minutes=15)
-
-    for i in range(4 * 6):
-        # temp id format:
-        #
-        # b64encode(
-        #   Encrypt(
-        #       uuid_bytes (16 bytes) || start_time (4 bytes) || end_time (4 bytes)
-        #   ) (24 bytes) ||
-        #   nonce (12 bytes) ||
-        #   tag (16 bytes)
-        # )
-
-        # Encrypt with AES-GCM
-        # https://pycryptodome.readthedocs.io/en/latest/src/cipher/modern.html#gcm-mode
-
-        epoch_start_bytes = int(epoch_start.timestamp()).to_bytes(4, 'big')
-        epoch_end_bytes = int(epoch_end.timestamp()).to_bytes(4, 'big')
-        # print(int(epoch_start.timestamp()), epoch_start_bytes.hex().upper())
-        # print(int(epoch_end.timestamp()), epoch_end_bytes.hex().upper())
-
-        nonce = get_random_bytes(12)    # 96 bit / 12 byte IV
-
-        plaintext = uuid_bytes + epoch_start_bytes + epoch_end_bytes    # 24 bytes
-        # print(len(plaintext), plaintext)
-
-        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
-        # print(len(ciphertext), ciphertext.hex().upper())
-        # print(len(tag), tag.hex().upper())
-
-        # Combine ciphertext, nonce, and tag
-        temp_id_bytes = ciphertext + nonce + tag    # 52 bytes
-        temp_id = b64encode(temp_id_bytes)          # 72 bytes
-        # print(len(temp_id_bytes), temp_id_bytes)
-        # print(len(temp_id), temp_id)
-
-        temp_ids.append({
-            'temp_id': temp_id.decode('utf-8'),
-            'start': int(epoch_start.timestamp()),
-            'end': int(epoch_end.timestamp())
-        })
-
-        # Increment epoch_start and epoch_end by 15 minutes
-        epoch_start = epoch_end
-        epoch_end += timedelta(minutes=15)
-
-    return temp_ids, int(epoch_start.timestamp())
-
-def decrypt_temp_id(temp_id: dict, key: bytes, user_id: uuid.UUID, user_recent_infection) -> bool:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Reasons an uploaded temp ID record is rejected.
+REJECT_MALFORMED = 'malformed'
+REJECT_INVALID_TEMP_ID = 'invalid_temp_id'
+REJECT_OUTSIDE_EPOCH = 'outside_epoch'
+REJECT_SELF_CONTACT = 'self_contact'
+
+
+def _check_shape(temp_id: dict) -> bool:
+    if not isinstance(temp_id, dict):
+        return False
     if 'temp_id' not in temp_id or 'contact_timestamp' not in temp_id or 'rssi' not in temp_id:
         return False
     if not isinstance(temp_id['contact_timestamp'], int) or not isinstance(temp_id['rssi'], int):
         return False
-    try:
-        temp_id_bytes = b64decode(temp_id['temp_id'])
-        ciphertext = temp_id_bytes[:24]
-        nonce = temp_id_bytes[24:36]
-        tag = temp_id_bytes[36:]
-
-        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-        plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-        uuid_bytes = plaintext[:16]
-        epoch_start_bytes = plaintext[16:20]
-        epoch_end_bytes = plaintext[20:]
-
-        contact_uuid = uuid.UUID(bytes=uuid_bytes)
-        epoch_start = int.from_bytes(epoch_start_bytes, 'big')
-        epoch_end = int.from_bytes(epoch_end_bytes, 'big')
-        if not (epoch_start <= temp_id['contact_timestamp'] <= epoch_end):
-            return False
-        
-        # Do not save records that are on themselves.
-        if user_id == contact_uuid:
-            return False
-        
-        temp_id['contact_timestamp'] = datetime.fromtimestamp(temp_id['contact_timestamp'])
-        temp_id['infected_user'] = user_id
-        temp_id['contacted_user'] = contact_uuid
-        temp_id['infectionhistory'] = user_recent_infection
-    except:
+    return isinstance(temp_id['temp_id'], str)
+
+
+def _check_sighting(temp_id: dict, decrypted, user_id: uuid.UUID, user_recent_infection) -> Optional[str]:
+    '''
+    Checks one sighting against its already decrypted temp ID, filling in the close
+    contact fields. Returns None if the record is accepted, otherwise the reason it
+    was rejected.
+    '''
+    if decrypted is None:
+        return REJECT_INVALID_TEMP_ID
+    contact_uuid, epoch_start, epoch_end = decrypted
+    if not (epoch_start <= temp_id['contact_timestamp'] <= epoch_end):
+        return REJECT_OUTSIDE_EPOCH
+
+    # Do not save records that are on themselves.
+    if user_id == contact_uuid:
+        return REJECT_SELF_CONTACT
+
+    temp_id['contact_timestamp'] = datetime.fromtimestamp(temp_id['contact_timestamp'])
+    temp_id['infected_user'] = user_id
+    temp_id['contacted_user'] = contact_uuid
+    temp_id['infectionhistory'] = user_recent_infection
+    return None
+
+
+def decrypt_temp_id(temp_id: dict, keys: list[bytes], user_id: uuid.UUID, user_recent_infection) -> bool:
+    if not _check_shape(temp_id):
         return False
+    decrypted = _decrypt_temp_id_value(temp_id['temp_id'], keys)
+    return _check_sighting(temp_id, decrypted, user_id, user_recent_infection) is None
+
+
+_decrypt_executor = None
+_decrypt_executor_lock = threading.Lock()
+
+
+def _get_decrypt_executor() -> ProcessPoolExecutor:
+    global _decrypt_executor
+    with _decrypt_executor_lock:
+        if _decrypt_executor is None:
+            # Spawned rather than forked: the workers only run the functions in
+            # tempid_crypto and must not inherit the parent's threads, sockets or DB
+            # connections. That module must stay importable without Django set up.
+            _decrypt_executor = ProcessPoolExecutor(
+                max_workers=settings.TEMP_ID_DECRYPT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _decrypt_executor
+
+
+def _discard_decrypt_executor(executor: ProcessPoolExecutor):
+    global _decrypt_executor
+    with _decrypt_executor_lock:
+        if _decrypt_executor is executor:
+            _decrypt_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _decrypt_distinct(temp_ids: list[str], keys: list[bytes]) -> dict[str, Optional[tuple[uuid.UUID, int, int]]]:
+    workers = settings.TEMP_ID_DECRYPT_WORKERS
+    if workers <= 1 or len(temp_ids) < settings.TEMP_ID_PARALLEL_MIN_RECORDS:
+        return _decrypt_temp_id_values(temp_ids, keys)
+
+    # A few chunks per worker keeps the pool busy if some chunks finish early.
+    chunk_size = -(-len(temp_ids) // (workers * 4))
+    chunks = [temp_ids[i:i + chunk_size] for i in range(0, len(temp_ids), chunk_size)]
+    executor = _get_decrypt_executor()
+    decrypted = {}
+    try:
+        for chunk in executor.map(partial(_decrypt_temp_id_values, keys=keys), chunks):
+            decrypted.update(chunk)
+    except BrokenProcessPool:
+        # A dead worker breaks the pool for good; replace it for the next upload and
+        # finish this one inline.
+        _discard_decrypt_executor(executor)
+        logger.warn('Temp ID decrypt pool broke; decrypting inline.', extra={'action': 'upload_temp_ids'})
+        return _decrypt_temp_id_values(temp_ids, keys)
+    return decrypted
+
+
+def decrypt_temp_ids(temp_ids: list[dict], keys: list[bytes], user_id: uuid.UUID, user_recent_infection, decrypted: dict = None) -> tuple[list[dict], Counter]:
+    '''
+    Decrypts and verifies a whole upload against the keyring `keys`.
+
+    A phone sees the same beacon many times per epoch, so records are grouped by
+    temp ID and each distinct ciphertext is decrypted only once. Each sighting is then
+    checked against the decrypted epoch bounds and owner. `decrypted` can be passed in
+    to reuse decryptions across calls, e.g. over the chunks of one upload.
+
+    When at least TEMP_ID_PARALLEL_MIN_RECORDS distinct temp IDs need decrypting they
+    are split into chunks across this web worker's process pool of
+    TEMP_ID_DECRYPT_WORKERS workers (its share of the cores by default). Fewer are
+    decrypted inline, where the pool overhead is not worth it.
+
+    Returns the accepted records, in upload order, and a count of rejected records per reason.
+    '''
+    if decrypted is None:
+        decrypted = {}
+    rejected = Counter()
+
+    well_formed = []
+    for temp_id in temp_ids:
+        if _check_shape(temp_id):
+            well_formed.append(temp_id)
+        else:
+            rejected[REJECT_MALFORMED] += 1
 
-    return True
+    pending = list({temp_id['temp_id'] for temp_id in well_formed if temp_id['temp_id'] not in decrypted})
+    if pending:
+        decrypted.update(_decrypt_distinct(pending, keys))
 
+    accepted = []
+    for temp_id in well_formed:
+        reason = _check_sighting(temp_id, decrypted[temp_id['temp_id']], user_id, user_recent_infection)
+        if reason is None:
+            accepted.append(temp_id)
+        else:
+            rejected[reason] += 1
+    return accepted, rejected
@@ -1,29 +1,45 @@
+from asgiref.sync import sync_to_async
+from collections import Counter
 from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveUpdateAPIView
 from rest_framework.response import Response
-from datetime import date, timedelta, datetime
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import IsAuthenticated
 
-from accounts.vault import create_vault_client
-from .models import (
-    Infectionhistory,
-    Closecontacts,
-    Notifications
-)
+from accounts.async_views import AsyncAPIView
 from .serializers import (
     CloseContactSerializer,
     UserSerializer
 )
-from .utils import get_or_generate_secret_key, generate_temp_ids, decrypt_temp_id
+from .parsers import TempIdUploadParser
+from .status import (
+    active_upload_notification,
+    get_infection_status,
+    aget_infection_status,
+    get_upload_requirement_status,
+    aget_upload_requirement_status
+)
+from .utils import temp_id_key_provider, get_temp_ids, decrypt_temp_ids, chunked
 
 import logging
 logger = logging.getLogger('loki')
 
+def _requested_epochs(request) -> int:
+    epochs = request.query_params.get('epochs', settings.TEMP_ID_EPOCHS)
+    try:
+        epochs = int(epochs)
+    except (TypeError, ValueError):
+        raise ValidationError('epochs must be an integer')
+    if not (1 <= epochs <= settings.TEMP_ID_MAX_EPOCHS):
+        raise ValidationError(f'epochs must be between 1 and {settings.TEMP_ID_MAX_EPOCHS}')
+    return epochs
+
+
 # Create your views here.
 class GenerateTemporaryIdsView(ListAPIView):
 
@@ -31,9 +47,8 @@ class GenerateTemporaryIdsView(ListAPIView):
 
     def list(self, request):
         user_id = request.user.id
-        vault_client = create_vault_client()
-        temp_id_key = get_or_generate_secret_key(vault_client, settings.VAULT_TEMP_ID_KEY_PATH)
-        temp_ids, start_time = generate_temp_ids(user_id, temp_id_key)
+        epochs = _requested_epochs(request)
+        temp_ids, start_time = get_temp_ids(user_id, epochs)
         payload = {
             'temp_ids': temp_ids,
             'server_start_time': start_time,
@@ -45,47 +60,49 @@ class GenerateTemporaryIdsView(ListAPIView):
 class UploadTemporaryIdsView(CreateAPIView):
 
     permission_classes = (IsAuthenticated,)
+    parser_classes = (TempIdUploadParser,)
     serializer_class = CloseContactSerializer
 
     def create(self, request):
         user_id = request.user.id
         logging.info('Upload temporary IDs.', extra={'action': 'upload_temp_ids', 'request': request, 'user_id': user_id})
-        user_recent_infection_history = Infectionhistory.objects.filter(
-            user_id = user_id,
-            recorded_timestamp__range=(
-                timezone.now() - timedelta(days=15),
-                timezone.now()
-            ))
-        if user_recent_infection_history.count() == 0:
-            raise ValidationError('User has no recent infection history')
-        
-        user_recent_infection = user_recent_infection_history.latest("recorded_timestamp")
-        
-        notification = Notifications.objects.filter(infection_id=user_recent_infection.id, uploaded_status=False)
-        if not notification.exists():
-            raise ValidationError('User has no recent infection history')
-        latest_notification = notification.latest('due_date')
-
-        if latest_notification.due_date < timezone.now().date():
-            raise ValidationError('User has no recent infection history')
-
-        temp_ids = request.data.get('temp_ids')
-        if temp_ids is None or type(temp_ids) != list or len(temp_ids) == 0:
-            raise ValidationError('Missing temp_ids')
-        
-        vault_client = create_vault_client()
-        temp_id_key = get_or_generate_secret_key(vault_client, settings.VAULT_TEMP_ID_KEY_PATH)
-        final_temp_ids = list(filter(lambda x: decrypt_temp_id(x, temp_id_key, user_id, user_recent_infection.id), temp_ids))
-        
-        if len(final_temp_ids) == 0:
-            raise ValidationError('No valid temp_ids')
-        
-        serial = self.serializer_class(data=final_temp_ids, many=True)
-        serial.is_valid(raise_exception=True)
-
-        latest_notification.uploaded_status = True
-        serial.save()
-        latest_notification.save()
+        temp_id_keys = temp_id_key_provider.get_keys()
+        # Records are streamed from the request body and go through decrypt -> validate
+        # -> insert in bounded chunks. The transaction keeps the upload all-or-nothing.
+        received = 0
+        accepted = 0
+        rejected = Counter()
+        decrypted = {}
+        with transaction.atomic(using='main_db'):
+            # Locks the notification: a concurrent upload for the same infection waits
+            # here until this one commits, then no longer finds it pending.
+            notification = active_upload_notification(user_id, timezone.now()).first()
+            if notification is None:
+                raise ValidationError('User has no recent infection history')
+
+            for temp_ids in chunked(request.data.get('temp_ids', ()), settings.TEMP_ID_UPLOAD_CHUNK_SIZE):
+                received += len(temp_ids)
+                final_temp_ids, chunk_rejected = decrypt_temp_ids(temp_ids, temp_id_keys, user_id, notification.infection_id, decrypted)
+                rejected.update(chunk_rejected)
+                if not final_temp_ids:
+                    continue
+
+                serial = self.serializer_class(data=final_temp_ids, many=True)
+                serial.is_valid(raise_exception=True)
+                serial.save()
+                accepted += len(serial.validated_data)
+                if serial.dropped:
+                    rejected['unknown_user'] += serial.dropped
+
+            if rejected:
+                logging.info('Rejected temporary IDs.', extra={'action': 'upload_temp_ids', 'request': request, 'user_id': user_id, 'rejected': dict(rejected)})
+            if received == 0:
+                raise ValidationError('Missing temp_ids')
+            if accepted == 0:
+                raise ValidationError('No valid temp_ids')
+
+            notification.uploaded_status = True
+            notification.save(update_fields=['uploaded_status'])
         logging.info('Uploaded temporary IDs.', extra={'action': 'upload_temp_ids', 'request': request, 'user_id': user_id})
         return Response(status=status.HTTP_201_CREATED)
 
@@ -97,39 +114,58 @@ class GetInfectionStatusView(APIView):
     def get(self, request):
         user_id = request.user.id
         logging.info('Get infection status.', extra={'action': 'get_infection_status', 'request': request, 'user_id': user_id})
-        user_recent_infection_history = Infectionhistory.objects.filter(
-            user_id = user_id,
-            recorded_timestamp__range=(
-                timezone.now() - timedelta(days=15),
-                timezone.now()
-            ))
-        if user_recent_infection_history.count() > 0:
-            return Response(data={'status': 'positive'}, status=status.HTTP_200_OK)
+        return Response(data={'status': get_infection_status(user_id)}, status=status.HTTP_200_OK)
 
-        user_recent_close_contact_history = Closecontacts.objects.filter(
-            contacted_user_id = user_id,
-            contact_timestamp__range=(
-                timezone.now() - timedelta(days=15),
-                timezone.now()
-            )
-        )
 
-        if user_recent_close_contact_history.count() > 0:
-            return Response(data={'status': 'close'}, status=status.HTTP_200_OK)
+class GetUploadRequirementStatusView(APIView):
+
+    permission_classes = (IsAuthenticated,)
 
-        return Response(data={'status': 'negative'}, status=status.HTTP_200_OK)
+    def get(self, request):
+        user_id = request.user.id
+        logging.info('Get upload requirement status.', extra={'action': 'get_upload_requirement_status', 'request': request, 'user_id': user_id})
+        return Response(data={'status': get_upload_requirement_status(user_id)}, status=status.HTTP_200_OK)
 
 
-class GetUploadRequirementStatusView(APIView):
+class AsyncGenerateTemporaryIdsView(AsyncAPIView):
+    """ASGI variant of GenerateTemporaryIdsView."""
 
     permission_classes = (IsAuthenticated,)
 
-    def get(self, request):
+    async def get(self, request):
+        user_id = request.user.id
+        epochs = _requested_epochs(request)
+        # A cache miss reads the key from Vault; run it off the event loop so other
+        # requests keep being served while it is in flight.
+        temp_ids, start_time = await sync_to_async(get_temp_ids, thread_sensitive=False)(user_id, epochs)
+        payload = {
+            'temp_ids': temp_ids,
+            'server_start_time': start_time,
+        }
+        logging.info('Generated temporary IDs.', extra={'action': 'generate_temp_ids', 'request': request, 'user_id': user_id})
+        return Response(data=payload, status=status.HTTP_200_OK)
+
+
+class AsyncGetInfectionStatusView(AsyncAPIView):
+    """ASGI variant of GetInfectionStatusView."""
+
+    permission_classes = (IsAuthenticated,)
+
+    async def get(self, request):
+        user_id = request.user.id
+        logging.info('Get infection status.', extra={'action': 'get_infection_status', 'request': request, 'user_id': user_id})
+        return Response(data={'status': await aget_infection_status(user_id)}, status=status.HTTP_200_OK)
+
+
+class AsyncGetUploadRequirementStatusView(AsyncAPIView):
+    """ASGI variant of GetUploadRequirementStatusView."""
+
+    permission_classes = (IsAuthenticated,)
+
+    async def get(self, request):
         user_id = request.user.id
         logging.info('Get upload requirement status.', extra={'action': 'get_upload_requirement_status', 'request': request, 'user_id': user_id})
-        if Notifications.objects.filter(infection__user_id=user_id, start_date__lte=timezone.now().date(), due_date__gte=timezone.now().date(), uploaded_status=False).exists():
-            return Response(data={'status': True}, status=status.HTTP_200_OK)
-        return Response(data={'status': False}, status=status.HTTP_200_OK)
+        return Response(data={'status': await aget_upload_requirement_status(user_id)}, status=status.HTTP_200_OK)
 
 
 class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
@@ -139,8 +175,11 @@ class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
     def retrieve(self, request) -> Response:
         """Return user on GET request."""
         logging.info('Get user details.', extra={'action': 'get_user', 'request': request, 'user_id': request.user.id})
-        queryset = UserSerializer.Meta.model.objects.all()
-        user = get_object_or_404(queryset, id=request.user.id)
+        # Loaded (or taken from the identity cache) by TwoFactorAuthentication.
+        user = getattr(request, 'contact_user', None)
+        if user is None:
+            queryset = UserSerializer.Meta.model.objects.all()
+            user = get_object_or_404(queryset, id=request.user.id)
         serializer = self.serializer_class(user, context={'request': request})
 
         return Response(serializer.data, status=status.HTTP_200_OK) 